@@ -26,6 +26,8 @@ def create_app(name: str = None) -> Flask:
             app.config.from_pyfile("instance/production.py")
     else:
         raise ValidationError(f"无效配置名{name}")
+    # 扫描跟踪等独立进程按同一配置创建应用
+    app.config["CONFIG_NAME"] = name
 
     # 从环境变量加载配置（覆盖文件配置）
     app.config.from_prefixed_env()
@@ -3,6 +3,7 @@ from .scan_task import ScanTask
 from .vulnerability import Vulnerability
 from .user_feedback import UserFeedback
 from .risk_report import RiskReport
+from .vul_embedding import VulEmbedding
 
 __all__ = [
     "User",
@@ -10,4 +11,5 @@ __all__ = [
     "Vulnerability",
     "UserFeedback",
     "RiskReport",
+    "VulEmbedding",
 ]
\ No newline at end of file
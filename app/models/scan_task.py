@@ -5,9 +5,15 @@ from app.utils.exceptions import ValidationError
 
 class ScanTask(db.Model):
     __tablename__ = "scan_tasks"
+    __table_args__ = (
+        # 多个ZAP实例的扫描ID各自从0开始，只在同一实例内唯一；NULL不参与唯一约束，
+        # 启动扫描时总是记录实例，升级前的任务由scripts/upgrade_schema.py回填
+        db.UniqueConstraint("zap_endpoint", "zap_id", name="uq_task_zap_scan"),
+    )
     task_id = db.Column(db.Integer, primary_key=True)
     awvs_id = db.Column(db.String(40), unique=True)
-    zap_id = db.Column(db.String(10), unique=True)
+    zap_id = db.Column(db.String(10))
+    zap_endpoint = db.Column(db.String(255), comment="ZAP扫描所在的实例")
     xray_port = db.Column(db.Integer, nullable=True)
     task_name = db.Column(db.String(255), nullable=False, unique=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), nullable=False)
@@ -0,0 +1,11 @@
+"""漏洞描述向量缓存模型"""
+from datetime import datetime
+from app.extensions import db
+
+class VulEmbedding(db.Model):
+    __tablename__ = "vul_embeddings"
+    content_hash = db.Column(db.String(32), primary_key=True, comment="预处理后描述文本的md5")
+    model = db.Column(db.String(64), primary_key=True, comment="生成向量的模型标识")
+    dim = db.Column(db.Integer, nullable=False, comment="向量维度")
+    vector = db.Column(db.LargeBinary, nullable=False, comment="float32小端序向量")
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
@@ -5,16 +5,24 @@ from app.extensions import db
 
 class Vulnerability(db.Model):
     __tablename__ = "vulnerabilities"
+    __table_args__ = (
+        # 扫描器侧ID只在单个任务内可靠（如ZAP重启后告警ID重新计数），唯一键包含task_id
+        db.UniqueConstraint("task_id", "scan_source", "scan_id", name="uq_vul_task_source_scan"),
+    )
     vul_id = db.Column(db.Integer, primary_key=True)
     task_id = db.Column(db.Integer, db.ForeignKey("scan_tasks.task_id", ondelete="CASCADE"), nullable=False)
     scan_source = db.Column(db.String(10), nullable=False, comment="扫描出漏洞的扫描工具")
-    scan_id = db.Column(db.String(40), unique=True, comment="在对应扫描工具中的id")
+    scan_id = db.Column(db.String(40), comment="在对应扫描工具中的id")
     vul_type = db.Column(db.String(255))
+    url = db.Column(db.String(1024), comment="漏洞所在URL")
+    plugin_id = db.Column(db.String(64), comment="扫描工具中的检测插件ID")
+    message_id = db.Column(db.String(40), comment="扫描工具中触发漏洞的请求消息ID")
     severity = db.Column(db.Enum("critical", "high", "medium", "low", "info"), default="info", nullable=False)
     details = db.Column(db.Text, comment="攻击详情")
     description = db.Column(db.Text, comment="漏洞描述")
     solution = db.Column(db.Text, comment="修复建议")
     time = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    hit_count = db.Column(db.Integer, default=1, nullable=False, comment="重复命中次数")
 
     task = db.relationship("ScanTask", back_populates="vulnerabilities")
 
@@ -1,9 +1,11 @@
 """扫描任务管理路由"""
-from flask import Blueprint, g, request, jsonify, send_file
+from flask import Blueprint, current_app, g, request, jsonify, send_file
 from app.models.task_log import TaskLog
 from app.services.task import TaskService
-from app.utils.decorators import api_key_required, jwt_required
+from app.services.scanner.AWVS import AWVS
+from app.utils.decorators import api_key_required, jwt_required, require_role
 from app.utils.exceptions import AppException, ValidationError, Forbidden, InternalServerError, ValidationError
+from app.utils.poll_policy import poll_policy
 from app.utils.validation import InputValidator
 
 tasks_bp = Blueprint("tasks", __name__)
@@ -39,6 +41,37 @@ def create_task():
     except Exception as e:
         raise InternalServerError(f"任务创建失败:{e}")
 
+@tasks_bp.route("/bulk-create", methods=["POST"])
+@api_key_required
+@jwt_required
+def bulk_create_tasks():
+    """批量创建任务，立即返回作业ID，AWVS目标注册在后台并发完成"""
+    try:
+        items = (request.get_json() or {}).get("tasks")
+        if not isinstance(items, list):
+            raise ValidationError("tasks必须为列表")
+        job_id, tasks = TaskService.bulk_create_tasks(g.current_user["user_id"], items)
+        return jsonify({
+            "job_id": job_id,
+            "tasks": [{"task_id": task.task_id, "task_name": task.task_name, "status": task.status} for task in tasks]
+        }), 202
+    except AppException:
+        raise
+    except Exception as e:
+        raise InternalServerError(f"批量创建任务失败: {e}")
+
+@tasks_bp.route("/bulk-jobs/<job_id>", methods=["GET"])
+@api_key_required
+@jwt_required
+def get_bulk_job(job_id):
+    """查询批量创建作业进度与每个任务的结果"""
+    try:
+        return jsonify(TaskService.get_bulk_job(job_id)), 200
+    except AppException:
+        raise
+    except Exception as e:
+        raise InternalServerError(f"获取批量作业失败: {e}")
+
 @tasks_bp.route("/gettasks", methods=["GET"])
 @api_key_required
 @jwt_required
@@ -137,6 +170,21 @@ def get_status_stats():
     except Exception as e:
         raise InternalServerError(f"获取任务状态统计失败: {str(e)}")
 
+@tasks_bp.route("/scanner-metrics", methods=["GET"])
+@api_key_required
+@jwt_required
+@require_role("admin")
+def get_scanner_metrics():
+    """获取扫描器接口请求耗时统计（所有进程合计）；传入task_id时附带该任务各扫描器的轮询次数"""
+    try:
+        metrics = {"awvs": AWVS.http_metrics()}
+        task_id = request.args.get("task_id", type=int)
+        if task_id:
+            metrics["polls"] = {scanner: poll_policy(scanner, current_app.config).stats(task_id) for scanner in ("AWVS", "ZAP")}
+        return jsonify(metrics), 200
+    except Exception as e:
+        raise InternalServerError(f"获取扫描器接口统计失败: {str(e)}")
+
 @tasks_bp.route("/start", methods=["POST"])
 @api_key_required
 @jwt_required
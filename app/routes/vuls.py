@@ -94,4 +94,17 @@ def get_high_risk_count():
             "count": count if count else 0
         }), 200
     except Exception as e:
-        raise InternalServerError(f"获取高风险漏洞数量失败: {str(e)}")
\ No newline at end of file
+        raise InternalServerError(f"获取高风险漏洞数量失败: {str(e)}")
+
+@vuls_bp.route("/<int:vul_id>/snapshot", methods=["GET"])
+@api_key_required
+@jwt_required
+def get_vul_snapshot(vul_id):
+    """按需获取漏洞的请求/响应快照"""
+    try:
+        snapshot = VulService.get_snapshot(vul_id)
+        return jsonify({"vul_id": vul_id, "snapshot": snapshot}), 200
+    except AppException:
+        raise
+    except Exception as e:
+        raise InternalServerError(f"获取漏洞快照失败: {str(e)}")
\ No newline at end of file
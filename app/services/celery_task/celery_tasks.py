@@ -1,82 +1,145 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
-import threading
-from app.extensions import celery, db
+from app.extensions import celery, db, redis_client
 from app.models.task_log import TaskLog
 from app.models.scan_task import ScanTask
 from app.services.scanner.AWVS import AWVS
-from app.services.scanner.ZAP import ZAP
-from app.utils.exceptions import AppException, ValidationError
+from app.services.scanner.adapter import ScanHandle
+from app.services.scanner.follower import register_scans, start_follower_process
+from app.utils.exceptions import ValidationError
+from app.utils.redis_lock import LeaderElection
+from app.utils.xray_watcher import XrayOutputWatcher
+from celery.exceptions import Ignore
 from celery.signals import worker_ready
 from flask import current_app
-import time
 
 logger = logging.getLogger(__name__)
 
 @worker_ready.connect
 def start_background_check(sender, **kwargs):
-    """Worker启动时自动创建后台检查线程"""
+    """Worker启动时监听Xray输出目录，文件增长时按任务触发解析，并启动AWVS/ZAP扫描跟踪进程；多个worker中仅选举出的主节点执行"""
     if not hasattr(sender.app, 'xray_check_started'):
         sender.app.xray_check_started = True
-        threading.Thread(target=run_periodic_check, daemon=True).start()
+        election = LeaderElection("xray_watcher_leader", ttl=current_app.config["XRAY_LEADER_TTL"])
+        election.start()
+        queued_ttl = current_app.config["XRAY_INGEST_QUEUED_TTL"]
+        XrayOutputWatcher(
+            current_app.config["XRAY_OUTPUT_PATH"],
+            on_change=lambda task_id: dispatch_xray_ingest(task_id, queued_ttl),
+            debounce=current_app.config["XRAY_WATCH_DEBOUNCE"],
+            poll_interval=current_app.config["XRAY_WATCH_POLL_INTERVAL"],
+            enabled=lambda: election.is_leader,
+            on_sweep=lambda: check_xray_vuls.delay(),
+            sweep_interval=current_app.config["XRAY_SWEEP_INTERVAL"],
+        ).start()
+        # 扫描跟踪会入库去重，放在独立进程中，避免在prefork主进程中加载模型、建立被子进程继承的连接
+        start_follower_process(current_app.config["CONFIG_NAME"])
 
-def run_periodic_check():
-    """后台线程循环执行检查"""
-    while True:
-        try:
-            check_xray_vuls.delay()
-        except Exception as e:
-            logger.error(f"后台检查异常: {str(e)}")
-        time.sleep(30)
-
-@celery.task(bind=True, max_retries=200)
-def save_awvs_vuls(self, task_id, scan_id):
+def dispatch_xray_ingest(task_id, queued_ttl: int) -> bool:
+    """投递单任务解析作业；已有排队中的作业时跳过"""
+    queued_key = f"xray_ingest_queued_{task_id}"
+    if not redis_client.set(queued_key, 1, nx=True, ex=queued_ttl):
+        return False
     try:
-        res = AWVS().save_vuls(task_id, scan_id)
-        if not res:
-            raise self.retry(countdown=30)
-        return True
-    except AppException:
-        raise 
-    except Exception as e:
-        logger.error(f"AWVS celery error: {e}")
+        ingest_xray_vuls.delay(task_id)
+    except Exception:
+        redis_client.delete(queued_key)
         raise
-        
-@celery.task(bind=True, max_retries=200)
-def save_zap_vuls(self, task_id, scan_id, url):
-    from flask import current_app as app
-    with app.app_context():
+    return True
+
+@celery.task(bind=True)
+def check_xray_vuls(self):
+    """为每个运行中的Xray任务投递一个解析作业，由worker池并行处理；由输出监听的主节点定时触发兜底"""
+    from app.services.scanner.Xray import Xray
+    task_ids = [task_id for (task_id,) in db.session.query(ScanTask.task_id).filter(
+        ScanTask.status == "running", ScanTask.xray_port.isnot(None)
+    )]
+    # 已停止但收尾失败的任务继续重试，直到剩余输出完整入库
+    task_ids += [task_id for task_id in Xray.finalize_pending_tasks() if task_id not in task_ids]
+    queued_ttl = current_app.config["XRAY_INGEST_QUEUED_TTL"]
+    dispatched = 0
+    for task_id in task_ids:
         try:
-            res = ZAP().save_vuls(task_id, scan_id, url)
-            if not res:
-                raise self.retry(countdown=30)
-            return True
-        except AppException:
-            raise 
+            dispatched += dispatch_xray_ingest(task_id, queued_ttl)
         except Exception as e:
-            raise
+            logger.error(f"任务{task_id}投递Xray解析失败: {str(e)}")
+    logger.info(f"运行中Xray任务{len(task_ids)}个，投递解析作业{dispatched}个")
+    return dispatched
 
 @celery.task(bind=True)
-def check_xray_vuls(self):
-    """实时保存所有运行中Xray任务的漏洞"""
+def ingest_xray_vuls(self, task_id):
+    """解析单个任务新增的Xray输出；已停止但收尾失败的任务重试收尾"""
     from app.services.scanner.Xray import Xray
-    with current_app.app_context():
-        print("xray漏洞保存定时任务执行中")
-        running_tasks = ScanTask.query.filter_by(status="running").all()
-        logger.info(f"Running tasks count: {len(running_tasks)}")
-        xray = Xray(
-            xray_path=current_app.config["XRAY_PATH"],
-            output_dir=current_app.config["XRAY_OUTPUT_PATH"]
-        )
-        running_tasks = ScanTask.query.filter_by(status="running").all()
-        for task in running_tasks:
-            if task.xray_port:
-                try:
-                    if not xray.parse_results(task.task_id):
-                        logger.warning(f"任务{task.task_id}无新漏洞数据")
-                except Exception as e:
-                    logger.error(f"任务{task.task_id}漏洞保存失败: {str(e)}")
-        return True
+    # 开始执行即清除排队标记，执行期间的新增数据可再次投递
+    redis_client.delete(f"xray_ingest_queued_{task_id}")
+    xray = Xray(
+        xray_path=current_app.config["XRAY_PATH"],
+        output_dir=current_app.config["XRAY_OUTPUT_PATH"]
+    )
+    if task_id in Xray.finalize_pending_tasks():
+        return xray.finalize(task_id)
+    return xray.parse_results(task_id)
+
+def _adopt_legacy_scan(task_id, scanner: str, scan_id, endpoint=None):
+    """升级前以Celery任务组轮询的扫描转交扫描跟踪；任务组含两个扫描时一并登记，避免先结束的一方提前汇总状态"""
+    task = ScanTask.query.get(task_id)
+    if task is None or task.status != "running":
+        return
+    handles = {scanner: ScanHandle(task_id, scan_id, task.target_url, endpoint)}
+    if len(task.celery_task_ids or []) > 1:
+        handles["AWVS"] = ScanHandle(task_id, task.awvs_id, task.target_url)
+        handles["ZAP"] = ScanHandle(task_id, task.zap_id, task.target_url, task.zap_endpoint)
+    register_scans(task_id, handles, replace=False)
+    logger.info(f"任务{task_id}升级前的{scanner}轮询作业已转交扫描跟踪")
+
+@celery.task(bind=True, max_retries=None)
+def save_awvs_vuls(self, task_id, scan_id):
+    """已弃用：消费升级前入队的轮询作业，不返回结果，任务组回调不再触发，状态由扫描跟踪汇总"""
+    _adopt_legacy_scan(task_id, "AWVS", scan_id)
+    raise Ignore()
+
+@celery.task(bind=True, max_retries=None)
+def save_zap_vuls(self, task_id, scan_id, url, endpoint=None):
+    """已弃用：同save_awvs_vuls"""
+    _adopt_legacy_scan(task_id, "ZAP", scan_id, endpoint)
+    raise Ignore()
+
+@celery.task(bind=True)
+def register_awvs_targets(self, user_id, task_ids):
+    """批量创建任务的后台作业：并发注册AWVS目标并汇总每个任务的结果"""
+    from app.services.task import TaskService
+    tasks = ScanTask.query.filter(ScanTask.task_id.in_(task_ids)).all()
+    targets = []
+    for task in tasks:
+        login = task.login_info.split(",", 2) if task.login_info else [None, None, None]
+        targets.append((task.task_id, task.target_url, *login))
+    target_ids = AWVS().add_urls(targets)
+
+    results = {}
+    for task in tasks:
+        target_id = target_ids.get(task.task_id)
+        if target_id:
+            task.awvs_id = target_id
+            results[task.task_id] = {"task_name": task.task_name, "status": "created", "awvs_id": target_id}
+        else:
+            task.update_status("failed")
+            results[task.task_id] = {"task_name": task.task_name, "status": "failed", "error": "AWVS任务创建失败"}
+    db.session.commit()
+
+    for task in tasks:
+        TaskLog.add_log(task.task_id, "INFO" if task.awvs_id else "ERROR", "创建任务成功" if task.awvs_id else "AWVS任务创建失败")
+    created = [task for task in tasks if task.awvs_id]
+    if created:
+        app = current_app._get_current_object()
+
+        def check(task):
+            with app.app_context():
+                TaskService.is_url_accessible(task.task_id, task.target_url)
+
+        with ThreadPoolExecutor(max_workers=min(current_app.config["AWVS_DETAIL_CONCURRENCY"], len(created))) as pool:
+            list(pool.map(check, created))
+    return {"user_id": user_id, "results": results}
 
 @celery.task(bind=True,max_retries=5)
 def update_task_status(self, group_results, task_id: int):
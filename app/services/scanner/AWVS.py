@@ -1,12 +1,17 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 import logging
 import os
 from flask import current_app
 import requests
+from app.extensions import redis_client
 from app.models.task_log import TaskLog
 from app.models.vulnerability import Vulnerability
+from app.services.scanner.adapter import HttpScannerAdapter, ScanHandle, ScanStatus, create_async_client
 from app.services.vul import VulService
-from app.utils.exceptions import AppException, InternalServerError
+from app.utils.exceptions import AppException, BadGateway, InternalServerError
+from app.utils.http_session import SharedSession, create_session, shared_metrics
 from urllib3.exceptions import InsecureRequestWarning
 
 logger = logging.getLogger(__name__)
@@ -15,8 +20,45 @@ logger = logging.getLogger(__name__)
 requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
 
 
+AWVS_METRICS_KEY = "scanner_http_metrics_AWVS"
+
+def _build_session():
+    config = current_app.config
+    return create_session(
+        pool_size=config["AWVS_HTTP_POOL_SIZE"],
+        retries=config["AWVS_HTTP_RETRIES"],
+        backoff=config["AWVS_HTTP_BACKOFF"],
+        timeout=(config["AWVS_CONNECT_TIMEOUT"], config["AWVS_READ_TIMEOUT"]),
+        verify=False,
+        rate_limit=config["AWVS_RATE_LIMIT"],
+        metrics_key=AWVS_METRICS_KEY,
+    )
+
+# 所有AWVS实例共用连接池，避免每次调用重新握手
+_shared_session = SharedSession(_build_session)
+
+PROFILE_DICT = {
+    "full": "11111111-1111-1111-1111-111111111111",
+    "quick": "11111111-1111-1111-1111-111111111112",
+    "xss": "11111111-1111-1111-1111-111111111116",
+    "sql": "11111111-1111-1111-1111-111111111113",
+    "pass": "11111111-1111-1111-1111-111111111115",
+    "crawl_only": "11111111-1111-1111-1111-111111111117",
+}
+
+SEVERITY_MAP = {
+    "0": "info",
+    "1": "low",
+    "2": "medium",
+    "3": "high",
+    "4": "critical",
+}
+
+
 class AWVS:
     def __init__(self):
+        self.session = _shared_session.get()
+        self.detail_concurrency = max(current_app.config["AWVS_DETAIL_CONCURRENCY"], 1)
         self.api_base_url = current_app.config["AWVS_API_URL"]
         _api_key = current_app.config["AWVS_API_KEY"]
         self.auth_headers = {"X-Auth": _api_key, "content-type": "application/json"}
@@ -43,21 +85,14 @@ class AWVS:
         #     "wasc_threat_classification": "11111111-1111-1111-1111-111111111123"
         # }
 
-        self.profile_dict = {
-            "full": "11111111-1111-1111-1111-111111111111",
-            "quick": "11111111-1111-1111-1111-111111111112",
-            "xss": "11111111-1111-1111-1111-111111111116",
-            "sql": "11111111-1111-1111-1111-111111111113",
-            "pass": "11111111-1111-1111-1111-111111111115",
-            "crawl_only": "11111111-1111-1111-1111-111111111117",
-        }
+        self.profile_dict = PROFILE_DICT
 
     def add_url(self, task_id, url, login_url=None, login_username=None, login_password=None):
         """添加url到AWVS"""
         try:
             data = {"address": url, "description": "自动化添加，请勿删除"}
-            res = requests.post(
-                self.targets_api, headers=self.auth_headers, json=data, verify=False
+            res = self.session.post(
+                self.targets_api, headers=self.auth_headers, json=data
             )
             if res.status_code == 201:
                 if login_url:
@@ -72,7 +107,7 @@ class AWVS:
                             },
                         }
                     }
-                    login_res = requests.patch(f"{self.targets_api}/{res.json()["target_id"]}/configuration", headers=self.auth_headers, json=d, verify=False)
+                    login_res = self.session.patch(f"{self.targets_api}/{res.json()["target_id"]}/configuration", headers=self.auth_headers, json=d)
                     print(f"login_res:{login_res}")
                 return res.json()["target_id"]
             else:
@@ -85,30 +120,19 @@ class AWVS:
             logger.error(f"AWVS添加url失败 {str(e)}")
         return None
 
-    def start_scan(self, task_id, target_id, profile_key="full"):
-        """运行AWVS扫描任务"""
-        data = {
-            "target_id": target_id,
-            "profile_id": self.profile_dict.get(profile_key),
-            "schedule": {"disable": False, "start_date": None, "time_sensitive": False},
-        }
-        try:
-            res = requests.post(
-                self.scan_api, json=data, headers=self.auth_headers, verify=False
-            )
-            # logger.error(data)
-            if res.status_code == 201:
-                TaskLog.add_log(task_id, "INFO", "AWVS扫描启动成功")
-                # logger.info(res.json())
-                return res.json()["scan_id"]
-            else:
-                error_message = f"HTTP {res.status_code}: {res.text}"
-                TaskLog.add_log(task_id, "ERROR", f"AWVS扫描启动失败: {error_message}")
-        except Exception as e:
-            TaskLog.add_log(task_id, "ERROR", "AWVS扫描启动失败")
-            logger.error(f"AWVS启动扫描失败 {str(e)}")
-        return None
-    
+    def add_urls(self, targets):
+        """并发注册多个目标，targets为[(task_id, url, login_url, login_username, login_password)]，返回{task_id: target_id或None}"""
+        if not targets:
+            return {}
+        app = current_app._get_current_object()
+
+        def register(target):
+            with app.app_context():
+                return target[0], self.add_url(*target)
+
+        with ThreadPoolExecutor(max_workers=min(self.detail_concurrency, len(targets)), thread_name_prefix="awvs-target") as pool:
+            return dict(pool.map(register, targets))
+
     def set_proxy(self, task_id, target_id, port):
         try:
             data = {
@@ -119,11 +143,10 @@ class AWVS:
                     "protocol": "http"
                 }
             }
-            res = requests.patch(
+            res = self.session.patch(
                 f"{self.targets_api}/{target_id}/configuration",
                 headers=self.auth_headers,
                 json=data,
-                verify=False,
             )
             if not (res.status_code >= 200 and res.status_code < 300):
                 error_message = f"HTTP {res.status_code}: {res.text}"
@@ -144,133 +167,171 @@ class AWVS:
         except Exception as e:
             logger.error(f"AWVS删除扫描失败 {str(e)}")
 
-    def stop_scan(self, scan_id):
-        try:
-            stop_api = f"{self.scan_api}/{scan_id}/abort"
-            res = requests.post(stop_api, headers=self.auth_headers, verify=False)
-
-            if res.status_code != 204: logger.error(f"停止AWVS扫描失败: HTTP {res.status_code}: {res.text}")
-        except Exception as e:
-            raise InternalServerError(f"任务停止失败: {str(e)}")
-
     def get_scan(self, scan_id: str):
         try:
-            res = requests.get(
+            res = self.session.get(
                 url=f"{self.scan_api}/{scan_id}",
                 headers=self.auth_headers,
-                verify=False,
             )
             return res.json()
         except Exception as e:
             raise InternalServerError(f"获取扫描任务失败{str(e)}")
 
-    def get_vuls(self, scan_id, scan_session_id):
-        """获取任务漏洞列表"""
-        scan_result_api = (
-            f"{self.scan_api}/{scan_id}/results/{scan_session_id}/vulnerabilities"
+    @staticmethod
+    def _pair_statistics(vuln_list, statisticses):
+        """按vuln_id将漏洞与其概述配对，返回[(漏洞, 概述)]；概述中不存在的漏洞跳过"""
+        stats_by_id = {sta.get("vuln_id"): sta for sta in statisticses or []}
+        pairs = []
+        for vul in vuln_list:
+            sta = stats_by_id.get(vul.get("vuln_id"))
+            if sta is not None:
+                pairs.append((vul, sta))
+        return pairs
+
+    @staticmethod
+    def _load_watermark(task_id):
+        """已入库漏洞水位 {vuln_id: last_seen}"""
+        return {k.decode(): v.decode() for k, v in redis_client.hgetall(f"awvs_watermark_{task_id}").items()}
+
+    @staticmethod
+    def _save_watermark(task_id, seen, ttl):
+        if not seen:
+            return
+        key = f"awvs_watermark_{task_id}"
+        with redis_client.pipeline() as pipe:
+            pipe.hset(key, mapping=seen)
+            pipe.expire(key, ttl)
+            pipe.execute()
+
+    @staticmethod
+    def _filter_delta(vuln_list, watermark):
+        """仅保留新出现或last_seen变化的漏洞"""
+        return [vul for vul in vuln_list if watermark.get(vul.get("vuln_id")) != str(vul.get("last_seen"))]
+
+    @staticmethod
+    def _build_vulnerability(task_id, vul, sta, vul_detail):
+        return Vulnerability(
+            task_id=task_id,
+            scan_id=vul.get("vuln_id"),
+            scan_source="AWVS",
+            vul_type=vul_detail.get("vt_name"),
+            url=vul.get("affects_url"),
+            severity=SEVERITY_MAP.get(str(vul_detail.get("severity")), "info"),
+            description=vul_detail.get("description"),
+            details=vul_detail.get("details"),
+            solution=vul_detail.get("recommendation"),
+            time=datetime.fromisoformat(sta.get("time")).replace(tzinfo=timezone.utc),  # 确保使用UTC时间
         )
-        try:
-            response = requests.get(
-                scan_result_api, headers=self.auth_headers, verify=False
-            )
-            vuln_list = response.json().get("vulnerabilities", [])
-            return vuln_list
-        except Exception as e:
-            raise InternalServerError(f"获取漏洞列表失败{str(e)}")
 
-    def get_vuln_detail(self, scan_id, scan_session_id, vuln_id):
-        """获取任务中漏洞具体的漏洞信息"""
-        scan_vuln_detail_api = f"{self.scan_api}/{scan_id}/results/{scan_session_id}/vulnerabilities/{vuln_id}"
-        try:
-            response = requests.get(
-                scan_vuln_detail_api, headers=self.auth_headers, verify=False
-            )
-            return response.json()
-        except Exception as e:
-            raise InternalServerError(f"获取漏洞列表失败: {str(e)}")
+    @staticmethod
+    def _store_results(task_id, vuls, last_seen, watermark, ttl):
+        """新漏洞走去重入库，已入库且有变化的漏洞原地更新，成功后推进水位"""
+        new_vuls = [v for v in vuls if v.scan_id not in watermark]
+        changed_vuls = [v for v in vuls if v.scan_id in watermark]
+        if new_vuls:
+            VulService._save_results(task_id, new_vuls)
+        if changed_vuls:
+            VulService._refresh_results(task_id, changed_vuls)
+        AWVS._save_watermark(task_id, {v.scan_id: last_seen[v.scan_id] for v in vuls}, ttl)
+
+    @staticmethod
+    def http_metrics():
+        """所有进程（Web与Celery worker）AWVS接口请求耗时直方图的合计，各进程每隔几秒汇总一次"""
+        return shared_metrics(AWVS_METRICS_KEY)
 
-    def get_vuln_statistics(self, scan_id, session_id):
-        """获取漏洞概述，主要用来获取漏洞时间"""
-        scan_vuln_statistics_api = (
-            f"{self.scan_api}/{scan_id}/results/{session_id}/statistics"
+class AsyncAWVSAdapter(HttpScannerAdapter):
+    """AWVS扫描的启动、跟踪与停止；增量水位与入库逻辑复用AWVS的静态方法，接口耗时计入AWVS_METRICS_KEY"""
+    name = "AWVS"
+
+    def __init__(self, config):
+        super().__init__(
+            create_async_client(
+                config["AWVS_API_URL"],
+                headers={"X-Auth": config["AWVS_API_KEY"], "content-type": "application/json"},
+                timeout=config["AWVS_READ_TIMEOUT"],
+                max_connections=config["AWVS_HTTP_POOL_SIZE"],
+                verify=False,
+            ),
+            concurrency=config["AWVS_DETAIL_CONCURRENCY"],
+            metrics_key=AWVS_METRICS_KEY,
+            retries=config["AWVS_HTTP_RETRIES"],
+            backoff=config["AWVS_HTTP_BACKOFF"],
+            # 与进程内共享的同步会话共用令牌桶，AWVS_RATE_LIMIT为整个进程的速率上限
+            rate_limiter=_shared_session.get().rate_limiter,
         )
-        try:
-            response = requests.get(
-                scan_vuln_statistics_api, headers=self.auth_headers, verify=False
-            )
-            return response.json()
-        except Exception as e:
-            raise InternalServerError(f"获取漏洞概述失败: {str(e)}")
+        self.watermark_ttl = config["AWVS_WATERMARK_TTL"]
+        self._sessions = {}  # scan_id -> scan_session_id
+        self._pending = {}  # task_id -> (last_seen, watermark)，入库成功后写入水位
 
-    def save_vuls(self, task_id, scan_id):
-        """AWVS获取指定任务的漏洞"""
+    async def start(self, task):
+        data = {
+            "target_id": task.awvs_id,
+            "profile_id": PROFILE_DICT.get(task.scan_type),
+            "schedule": {"disable": False, "start_date": None, "time_sensitive": False},
+        }
+        res = await self._request("POST", "/api/v1/scans", json=data)
+        if res.status_code != 201:
+            raise BadGateway(f"HTTP {res.status_code}: {res.text}")
+        return ScanHandle(task.task_id, res.json()["scan_id"], task.target_url)
+
+    async def poll(self, handle):
+        res = await self._request("GET", f"/api/v1/scans/{handle.scan_id}")
+        if res.status_code == 404:
+            # 扫描已被删除时视为结束；5xx与连接异常由_request抛出，跟踪时稍后重试
+            logger.error(f"AWVS扫描{handle.scan_id}不存在")
+            return ScanStatus(None, True)
+        session = res.json().get("current_session") or {}
+        if session.get("scan_session_id"):
+            self._sessions[handle.scan_id] = session["scan_session_id"]
+        progress = session.get("progress")
+        finished = session.get("status") in ("completed", "failed", "aborted") or progress == 100
+        return ScanStatus(progress, bool(finished and session.get("scan_session_id")))
+
+    async def fetch_results_delta(self, handle):
+        session_id = self._sessions.get(handle.scan_id)
+        if not session_id:
+            return []
+        base = f"/api/v1/scans/{handle.scan_id}/results/{session_id}"
+        vuln_list = (await self._request("GET", f"{base}/vulnerabilities")).json().get("vulnerabilities", [])
+        watermark = await asyncio.to_thread(AWVS._load_watermark, handle.task_id)
+        vuln_list = AWVS._filter_delta(vuln_list, watermark)
+        if not vuln_list:
+            return []
+        statistics = (await self._request("GET", f"{base}/statistics")).json()
+        pending = AWVS._pair_statistics(vuln_list, statistics.get("scanning_app", {}).get("wvs", {}).get("main", {}).get("vulns"))
+
+        async def fetch(vul):
+            try:
+                res = await self._request("GET", f"{base}/vulnerabilities/{vul.get('vuln_id')}")
+                return res.json()
+            except Exception as e:
+                logger.error(f"获取漏洞{vul.get('vuln_id')}详情失败: {str(e)}")
+                return None
+
+        details = await asyncio.gather(*(fetch(vul) for vul, _ in pending))
+        vuls = []
+        for (vul, sta), vul_detail in zip(pending, details):
+            if vul_detail is None:
+                continue
+            try:
+                vuls.append(AWVS._build_vulnerability(handle.task_id, vul, sta, vul_detail))
+            except Exception as e:
+                logger.error(f"获取漏洞详情失败: {str(e)}")
+        self._pending[handle.task_id] = ({vul.get("vuln_id"): str(vul.get("last_seen")) for vul, _ in pending}, watermark)
+        return vuls
+
+    def commit_results(self, handle, vuls):
+        last_seen, watermark = self._pending.pop(handle.task_id, ({}, {}))
+        AWVS._store_results(handle.task_id, vuls, last_seen, watermark, self.watermark_ttl)
+
+    async def stop(self, handle):
+        res = await self._request("POST", f"/api/v1/scans/{handle.scan_id}/abort")
+        if res.status_code != 204:
+            logger.error(f"停止AWVS扫描失败: HTTP {res.status_code}: {res.text}")
+        return res.status_code == 204
+
+    async def health(self):
         try:
-            res = self.get_scan(scan_id)
-            progress = res.get("current_session", {}).get("progress")
-            session_id = res.get("current_session", {}).get("scan_session_id")
-            if (
-                not session_id
-            ):  # 因AWVS任务状态类型颇多，此处会出现scan_session_id返回值为空的情况，故请求到有为止
-                return False
-            # 获取扫描的结果列表
-            vuln_list = self.get_vuls(scan_id, session_id)
-            if vuln_list:
-                vul_statistics = self.get_vuln_statistics(scan_id, session_id)
-                statisticses = (
-                    vul_statistics.get("scanning_app")
-                    .get("wvs")
-                    .get("main")
-                    .get("vulns")
-                )
-                vul_detail_list = []
-                map = {
-                    "0": "info",
-                    "1": "low",
-                    "2": "medium",
-                    "3": "high",
-                    "4": "critical",
-                }
-                for vul in vuln_list:
-                    try:
-                        num = None
-                        for index, sta in enumerate(statisticses):
-                            if vul.get("vuln_id") == sta.get("vuln_id"):
-                                num = index
-                                break
-                        if not num:
-                            continue
-                        vul_detail = self.get_vuln_detail(
-                            scan_id, session_id, vul.get("vuln_id")
-                        )
-                        vul_detail_list.append(
-                            Vulnerability(
-                                task_id=task_id,
-                                scan_id=vul.get("vuln_id"),
-                                scan_source="AWVS",
-                                vul_type=vul_detail.get("vt_name"),
-                                severity=map.get(
-                                    str(vul_detail.get("severity")), "info"
-                                ),
-                                description=vul_detail.get("description"),
-                                details=vul_detail.get("details"),
-                                solution=vul_detail.get("recommendation"),
-                                time=datetime.fromisoformat(
-                                    statisticses[num].get("time")
-                                ).replace(tzinfo=timezone.utc),  # 确保使用UTC时间
-                            )
-                        )
-                    except Exception as e:
-                        logger.error(f"获取漏洞详情失败: {str(e)}")
-                # 保存到数据库
-                if vul_detail_list:
-                    VulService._save_results(task_id, vul_detail_list)
-            res = self.get_scan(scan_id)
-            new_progress = res.get("current_session", {}).get("progress", 100)
-            if (new_progress == 100 and progress < 100) or new_progress < 100:
-                return False
-            return True
-        except AppException:
-            raise
-        except Exception as e:
-            TaskLog.add_log(task_id, "ERROR", f"集成AWVS扫描结果失败: {str(e)}")
-            raise InternalServerError(f"获取AWVS漏洞失败: {str(e)}")
+            return (await self._request("GET", "/api/v1/me")).status_code == 200
+        except Exception:
+            return False
@@ -1,29 +1,44 @@
+import codecs
 import os
 import json
-from random import randint
+import re
+from hashlib import sha1
 import signal
 import logging
 import subprocess
-import threading
 import socket
 from flask import current_app
 from datetime import datetime, timezone
 from app.models.task_log import TaskLog
 from app.models.vulnerability import Vulnerability
 from app.services.vul import VulService
+from app.utils.blob_store import BlobStore
 from app.utils.exceptions import InternalServerError
 from app.extensions import redis_client
 from app.utils.portPoll import PortPool
+from app.utils.redis_lock import RedisLease
+from app.utils.xray_archive import XrayArchive, punch_hole
 import psutil
 
+# Xray每条记录单行输出，换行后（可带数组逗号）以"{"开头即为下一条记录
+_RECORD_BOUNDARY = re.compile(r"\n[ \t\r]*,?[ \t\r]*\{")
+
 logger = logging.getLogger(__name__)
 
 class Xray:
+    READ_CHUNK_SIZE = 64 * 1024
+    MAX_RECORD_SIZE = 64 * 1024 * 1024
+    SAVE_BATCH_SIZE = 500
+    INGEST_LOCK_TTL = 120  # 解析锁租期(秒)，每批入库前续期
+    ARCHIVE_SEGMENT_SIZE = 8 * 1024 * 1024  # 已解析数据累计达到该字节数时归档为一个压缩段
+    FINALIZE_PENDING_KEY = "xray_finalize_pending"  # 已停止但剩余输出尚未完整入库的任务
+
     def __init__(self, xray_path=None, output_dir=None):
         self.xray_path = xray_path or current_app.config.get("XRAY_PATH")
         self.output_dir = output_dir or current_app.config.get("XRAY_OUTPUT_PATH")
+        self.archive_dir = current_app.config.get("XRAY_ARCHIVE_PATH") or os.path.join(self.output_dir, "archive")
+        self.snapshot_store = BlobStore(current_app.config["SNAPSHOT_STORE_PATH"])
         self.port_pool = PortPool(7777, 7799)
-        self.parse_lock = threading.Lock()
         os.makedirs(self.output_dir, exist_ok=True)
         
     def start_scan(self, task_id):
@@ -111,74 +126,205 @@ class Xray:
                 logger.error(f"进程{pid}终止失败！")
                 raise RuntimeError("无法终止Xray进程")
 
-            # 解析剩余数据
-            self.parse_results(task_id)
+            # 解析剩余数据（等待进行中的解析结束，确保尾部数据入库）
+            if not self.finalize(task_id, wait=self.INGEST_LOCK_TTL):
+                TaskLog.add_log(task_id, "ERROR", "Xray剩余输出未能完整入库，已保留输出文件，稍后自动重试")
 
             # 释放资源
             self.port_pool.release(task_id)
-            redis_client.delete(task_key)            
         except Exception as e:
             logger.error(f"[Xray] 停止异常: {str(e)}", exc_info=True)
             raise InternalServerError(f"停止扫描失败: {str(e)}")
 
-    def parse_results(self, task_id):
-        with self.parse_lock:
-            try:
-                task_data = redis_client.get(f"xray_task_{task_id}")
-                if not task_data:
-                    return False
-                    
-                task_info = json.loads(task_data)
-                output_file = task_info["output"]
-                start_pos = task_info.get("parsed_positions", 0)
-                
-                vul_list = []
-                with open(output_file, "r", encoding="utf-8") as f:
-                    f.seek(start_pos)
-                    raw_data = f.read().strip()
-                    
-                    # 修复1：处理可能的未闭合JSON数组结构
-                    if raw_data.startswith("["):
-                        raw_data = raw_data[1:]  # 移除开头的[
-                    if raw_data.endswith("]"):
-                        raw_data = raw_data[:-1]  # 移除结尾的]
-                    
-                    # 修复2：分割有效JSON对象（兼容末尾逗号）
-                    lines = []
-                    for line in raw_data.splitlines():
-                        line = line.strip()
-                        if line in ("", "[", "]", ","):
-                            continue
-                        if line.endswith(","):
-                            line = line[:-1]
-                        lines.append(line)
-                    
-                    # 逐行解析
-                    for line in lines:
-                        try:
-                            data = json.loads(line)
-                            vul = self._parse_vulnerability(data, task_id)
-                            if vul:
-                                vul_list.append(vul)
-                        except json.JSONDecodeError as e:
-                            logger.error(f"[{task_id}] 行解析失败: {str(e)}\n行内容: {line}")
-                            continue
-                    
-                    # 更新解析位置
-                    new_pos = f.tell()
-                    redis_client.set(f"xray_task_{task_id}", json.dumps({
-                        **task_info,
-                        "parsed_positions": new_pos
-                    }))
-
-                if vul_list:
-                    VulService._save_results(task_id, vul_list)
-                    logger.info(f"[Xray] 任务{task_id}新增{len(vul_list)}条漏洞")
-                return True
+    def finalize(self, task_id, wait=0):
+        """扫描进程退出后解析剩余输出并归档，成功后清理任务记录
+
+        失败（入库异常、解析锁未获取等）时保留活动输出文件与解析进度，记入待收尾集合，由兜底补扫重试。
+        """
+        if not redis_client.exists(f"xray_task_{task_id}"):
+            redis_client.srem(self.FINALIZE_PENDING_KEY, task_id)
+            return True
+        if self.parse_results(task_id, wait=wait, final=True):
+            redis_client.srem(self.FINALIZE_PENDING_KEY, task_id)
+            redis_client.delete(f"xray_task_{task_id}")
+            return True
+        redis_client.sadd(self.FINALIZE_PENDING_KEY, task_id)
+        return False
+
+    @classmethod
+    def finalize_pending_tasks(cls):
+        return [int(task_id) for task_id in redis_client.smembers(cls.FINALIZE_PENDING_KEY)]
+
+    def parse_results(self, task_id, wait=0, final=False):
+        """解析新增输出；同一任务跨worker互斥，锁被占用时标记待处理，由持锁方解析完后补跑
+
+        final=True用于扫描结束后：仅当剩余内容全部解析入库时才归档并删除活动输出文件，否则返回False。
+        """
+        lock = RedisLease(f"xray_ingest_lock_{task_id}", ttl=self.INGEST_LOCK_TTL)
+        pending_key = f"xray_ingest_pending_{task_id}"
+        if not lock.acquire(blocking_timeout=wait):
+            if final:
+                logger.error(f"[Xray] 任务{task_id}收尾时未获取到解析锁")
+                return False
+            redis_client.set(pending_key, 1, ex=int(self.INGEST_LOCK_TTL))
+            logger.debug(f"[Xray] 任务{task_id}正在其他worker解析，已标记待处理")
+            return True
+        try:
+            while True:
+                redis_client.delete(pending_key)
+                result = self._parse_new_records(task_id, lock)
+                if final:
+                    if not result:
+                        logger.error(f"[Xray] 任务{task_id}剩余输出解析失败，保留活动输出文件")
+                        return False
+                    self._warn_unparsed_tail(task_id)
+                    self._archive_consumed(task_id, final=True)
+                    return True
+                if not result or not redis_client.exists(pending_key):
+                    return result
+        finally:
+            lock.release()
+
+    def _warn_unparsed_tail(self, task_id):
+        """进程已退出且已解析到最后一条完整记录，剩余非分隔符内容只可能是写入中断的半条记录，随归档原样保留"""
+        task_data = redis_client.get(f"xray_task_{task_id}")
+        if not task_data:
+            return
+        task_info = json.loads(task_data)
+        try:
+            with open(task_info["output"], "rb") as f:
+                f.seek(task_info.get("parsed_positions", 0))
+                tail = f.read(self.READ_CHUNK_SIZE).strip(b" \t\r\n,[]")
+        except FileNotFoundError:
+            return
+        if tail:
+            logger.warning(f"[Xray] 任务{task_id}输出末尾存在不完整记录，已随归档保留: {tail[:200]}")
+            TaskLog.add_log(task_id, "WARNING", "Xray输出末尾存在写入中断的不完整记录，未入库，原始内容已归档")
+
+    def _parse_new_records(self, task_id, lock):
+        try:
+            task_data = redis_client.get(f"xray_task_{task_id}")
+            if not task_data:
+                return False
                 
-            except Exception as e:
-                logger.error(f"解析失败: {str(e)}", exc_info=True)
+            task_info = json.loads(task_data)
+            output_file = task_info["output"]
+            committed = task_info.get("parsed_positions", 0)
+            
+            vul_list = []
+            total = 0
+            with open(output_file, "rb") as f:
+                for record, end_pos in self._iter_records(f, committed, task_id):
+                    vul = self._parse_vulnerability(record, task_id)
+                    if vul:
+                        vul_list.append(vul)
+                    committed = end_pos
+                    # 分批入库并提交解析位置，内存只与单批记录相关
+                    if len(vul_list) >= self.SAVE_BATCH_SIZE:
+                        # 锁已过期被他人接管时放弃本批，避免同一区间重复入库
+                        if not lock.renew():
+                            logger.warning(f"[Xray] 任务{task_id}解析锁已失效，中止本次解析")
+                            return False
+                        VulService._save_results(task_id, vul_list)
+                        total += len(vul_list)
+                        vul_list = []
+                        task_info = self._commit_position(task_id, task_info, committed)
+
+            # 末尾不足一批的记录与解析位置同样需要持有锁才能提交
+            if (vul_list or committed != task_info.get("parsed_positions", 0)) and not lock.renew():
+                logger.warning(f"[Xray] 任务{task_id}解析锁已失效，中止本次解析")
                 return False
+            if vul_list:
+                VulService._save_results(task_id, vul_list)
+                total += len(vul_list)
+            # 仅推进到最后一个完整解析的对象之后，写入中的半条记录留待下次解析
+            if committed != task_info.get("parsed_positions", 0):
+                self._commit_position(task_id, task_info, committed)
+            self._archive_consumed(task_id, committed)
+            if total:
+                logger.info(f"[Xray] 任务{task_id}新增{total}条漏洞")
+            return True
+            
+        except Exception as e:
+            logger.error(f"解析失败: {str(e)}", exc_info=True)
+            return False
+
+    def _archive_consumed(self, task_id, position=None, final=False):
+        """将已解析区间滚动归档为压缩段；归档进度以段索引为准，中途失败下次从索引末尾重试"""
+        output_file = os.path.join(self.output_dir, f"{task_id}_xray.json")
+        try:
+            archive = XrayArchive(self.archive_dir, task_id)
+            archived = archive.archived_until()
+            if final:
+                # 进程已退出，剩余内容（含未闭合的尾部）全部归档后删除活动文件
+                if os.path.exists(output_file):
+                    archive.append(output_file, archived, os.path.getsize(output_file))
+                    os.remove(output_file)
+                return
+            if position - archived < self.ARCHIVE_SEGMENT_SIZE:
+                return
+            if archive.append(output_file, archived, position):
+                punch_hole(output_file, archived, position)
+                logger.debug(f"[Xray] 任务{task_id}归档区间[{archived}, {position})")
+        except Exception as e:
+            logger.error(f"[Xray] 任务{task_id}输出归档失败: {str(e)}")
+
+    def _commit_position(self, task_id, task_info, position):
+        task_info = {**task_info, "parsed_positions": position}
+        redis_client.set(f"xray_task_{task_id}", json.dumps(task_info))
+        return task_info
+
+    def _iter_records(self, f, offset, task_id=None):
+        """从字节偏移offset起流式解析Xray输出的JSON数组，逐个产出(对象, 对象结束处的字节偏移)
+
+        文件按块读取，缓冲区只保留当前未解析完的记录；文件末尾不完整的记录不产出。
+        无法解析的记录在下一条记录开头已读入时立即跳过，否则视为写入中的尾部记录，超过MAX_RECORD_SIZE才放弃。
+        """
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder("utf-8")()
+        f.seek(offset)
+        buf = ""
+        read_size = self.READ_CHUNK_SIZE
+        eof = False
+        while True:
+            # 跳过数组括号、分隔符和空白（均为单字节字符）
+            skip = 0
+            while skip < len(buf) and buf[skip] in " \t\r\n,[]":
+                skip += 1
+            if skip:
+                offset += skip
+                buf = buf[skip:]
+
+            if buf:
+                try:
+                    record, end = decoder.raw_decode(buf)
+                except json.JSONDecodeError:
+                    record = None
+                if isinstance(record, dict):
+                    offset += len(buf[:end].encode("utf-8"))
+                    buf = buf[end:]
+                    read_size = self.READ_CHUNK_SIZE
+                    yield record, offset
+                    continue
+                boundary = _RECORD_BOUNDARY.search(buf)
+                if boundary or len(buf) > self.MAX_RECORD_SIZE:
+                    # 当前记录已写完仍无法解析（或超长）视为损坏记录，跳到下一条记录开头
+                    next_start = boundary.start() if boundary else len(buf)
+                    logger.error(f"[{task_id}] 跳过无法解析的记录: {buf[:min(next_start, 200)]}")
+                    offset += len(buf[:next_start].encode("utf-8"))
+                    buf = buf[next_start:]
+                    continue
+
+            if eof:
+                return
+            chunk = f.read(read_size)
+            if not chunk:
+                eof = True
+                continue
+            buf += utf8.decode(chunk)
+            # 单条记录跨多个块时按倍数扩大读取量，避免对同一前缀反复解析
+            if buf and read_size < self.MAX_RECORD_SIZE:
+                read_size = max(read_size, len(buf))
 
     def get_active_tasks(self):
         """获取所有活跃的Xray任务"""
@@ -209,15 +355,23 @@ class Xray:
             logger.error(f"进程检查异常: {str(e)}")
             return True  # 保守处理
 
+    @staticmethod
+    def _fingerprint(vuln, task_id):
+        """根据任务、插件、目标URL与payload生成确定性的scan_id，同一漏洞重复上报时保持不变"""
+        payload_hash = sha1(str(vuln.get('detail', {}).get('payload', '')).encode("utf-8")).hexdigest()
+        raw = f"{task_id}\n{vuln['plugin']}\n{vuln['target']['url']}\n{payload_hash}"
+        return f"xray_{sha1(raw.encode('utf-8')).hexdigest()[:32]}"
+
     def _parse_vulnerability(self, vuln, task_id):
         """解析单个漏洞数据"""
         try:
-            scan_id = f"xray_{task_id}_{vuln['create_time']}_{randint(1, 9999)}"
+            scan_id = self._fingerprint(vuln, task_id)
             new_vuln = Vulnerability(
                 task_id=task_id,
                 scan_source="XRAY",
                 scan_id=scan_id,
                 vul_type=vuln['plugin'],
+                url=vuln['target']['url'],
                 severity=vuln.get('extra', {}).get('level', 'info').lower()  # 优先使用extra中的level
             )
             new_vuln.time = datetime.fromtimestamp(
@@ -230,10 +384,11 @@ class Xray:
                 for req, resp in detail.get('snapshot', [])]
             )
             
+            # 请求/响应快照体积大，存入Blob存储，行内只保留引用，按需通过接口读取
             new_vuln.details = json.dumps({
                 'target': vuln['target']['url'],
                 'payload': detail.get('payload', ''),
-                'snapshot': snapshot,
+                'snapshot_ref': self.snapshot_store.put(snapshot.encode("utf-8")) if snapshot else None,
                 'extra': vuln.get('extra', {})
             }, ensure_ascii=False)
 
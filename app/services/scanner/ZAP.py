@@ -1,195 +1,267 @@
+import asyncio
 from datetime import datetime, timezone
+from functools import partial
+from hashlib import sha1
+import json
 import logging
-import os
 import re
 from urllib.parse import urlparse
-from flask import current_app
-from zapv2 import ZAPv2
-from app.models.task_log import TaskLog
+from app.extensions import redis_client
 from app.models.vulnerability import Vulnerability
-from app.services.vul import VulService
-from app.utils.exceptions import InternalServerError
+from app.services.scanner.adapter import HttpScannerAdapter, ScanHandle, ScanStatus, create_async_client
+from app.services.scanner.zap_pool import ZAPPool
+from app.utils.exceptions import BadGateway
+from app.utils.redis_lock import RedisLease
 
 logger = logging.getLogger(__name__)
 
+SCAN_POLICIES = {
+    "full": {
+        "name": "Default Policy",
+        "all_scanners": True,
+        "attack_strength": "HIGH"
+    },
+    "sql": {
+        "name": "Policy_SQL",
+        "scanners": [40018, 40019, 40020, 40021, 40022, 40027],
+        "attack_strength": "HIGH",
+        "alert_threshold": "HIGH"
+    },
+    "xss": {
+        "name": "Policy_XSS",
+        "scanners": [40012, 40014, 40026],
+        "dependencies": [40017],
+        "alert_threshold": "HIGH"
+    },
+}
 
-class ZAP:
-    def __init__(self):
-        self.ZAP_API_KEY = os.getenv("ZAP_API_KEY", "your_api_key")
-        self._ZAP_PROXY = {
-            "http": current_app.config["ZAP_API_URL"],
-            "https": current_app.config["ZAP_API_URL"],
-        }
-        self.zap = ZAPv2(apikey=self.ZAP_API_KEY, proxies=self._ZAP_PROXY)
-
-    def start_scan(self, task_id: int, target_url: str, scan_type: str = "full", login_info: str = None):
-        """启动主动扫描"""
-        SCAN_POLICIES = {
-            "full": "Default Policy",
-            "sql": {
-                "name": "Policy_SQL",
-                "scanners": [40018, 40019, 40020, 40021, 40022, 40027],
-                "attack_strength": "HIGH",
-                "alert_threshold": "HIGH"
-            },
-            "xss": {
-                "name": "Policy_XSS",
-                "scanners": [40012, 40014, 40026],
-                "dependencies": [40017],
-                "alert_threshold": "HIGH"
-            },
-        }
-
-        policy_config = SCAN_POLICIES.get(scan_type)
-        if not policy_config: return None
+# ZAP扫描规则的策略分类ID：信息收集、客户端浏览器、服务器安全、其他、注入；策略级攻击强度按分类设置
+POLICY_CATEGORY_IDS = (0, 1, 2, 3, 4)
 
-        try:
-            context_name = f"ScanContext_{task_id}"
-            context_id = self.zap.context.new_context(context_name)
-
-            parsed_url = urlparse(target_url)
-            domain = parsed_url.netloc
-            escaped_domain = re.escape(domain)
-            context_regex = f"^{parsed_url.scheme}://{escaped_domain}/.*"
-
-            self.zap.context.include_in_context(context_name, context_regex)
-            self.zap.context.set_context_in_scope(context_name, True)
-            TaskLog.add_log(task_id, "INFO", f"ZAP上下文已配置: {context_regex}")
-        except Exception as e:
-            logger.error(f"ZAP上下文配置失败: {str(e)}")
-            TaskLog.add_log(task_id, "ERROR", "ZAP上下文配置失败")
-            return None
+def policy_fingerprint(policy_config) -> str:
+    return sha1(json.dumps(policy_config, sort_keys=True).encode("utf-8")).hexdigest()
 
-        if login_info:
-            try:
-                TaskLog.add_log(task_id, "INFO", f"login_info: {login_info}")
-                login_infos = login_info.split(",")
-                auth_method_config = f"loginUrl={login_infos[0]}&usernameParam={login_infos[1]}&passwordParam={login_infos[2]}"
-                self.zap.authentication.set_authentication_method(
-                    context_id,
-                    "formBasedAuthentication",
-                    auth_method_config
+def policy_cache_key(endpoint: str, policy_name: str) -> str:
+    """某个ZAP实例上已下发策略的配置指纹"""
+    return f"zap_policy_{endpoint}_{policy_name}"
+
+# 告警偏移的保留时间(秒)，扫描结束时由扫描跟踪删除，异常遗留的按过期清理
+ALERT_OFFSET_TTL = 7 * 24 * 3600
+
+def alert_offset_key(task_id) -> str:
+    return f"zap_alert_offset_{task_id}"
+
+def load_alert_offset(task_id) -> int:
+    """目标URL下告警列表（core/view/alerts）中已处理的条数，即下次分页拉取的起始位置"""
+    return int(redis_client.get(alert_offset_key(task_id)) or 0)
+
+def save_alert_offset(task_id, offset: int):
+    redis_client.set(alert_offset_key(task_id), offset, ex=ALERT_OFFSET_TTL)
+
+SEVERITY_MAP = {
+    "0": "info",
+    "1": "low",
+    "2": "medium",
+    "3": "high",
+    "4": "critical",
+}
+
+
+def parse_alerts(data):
+    """ZAP告警转为漏洞记录；一个任务只有一个ZAP扫描，告警ID在(task_id, scan_source)内唯一，所在实例由ScanTask.zap_endpoint记录"""
+    vul_list = []
+    for alert in data:
+        vul = Vulnerability(
+            scan_id=alert.get("id"),
+            scan_source="ZAP",
+            vul_type=alert.get("name"),
+            url=alert.get("url"),
+            plugin_id=alert.get("pluginId"),
+            message_id=alert.get("messageId"),
+            severity=SEVERITY_MAP.get(alert.get("risk"), "info"),
+            description=alert.get("description"),
+            details=alert.get("solution"),
+            solution=alert.get("reference"),
+            time=datetime.now().replace(tzinfo=timezone.utc),  # 使用UTC时间
+        )
+        vul_list.append(vul)
+    return vul_list
+
+
+class AsyncZAPAdapter(HttpScannerAdapter):
+    """ZAP JSON API的asyncio实现；按扫描ID获取告警，按已入库偏移做增量
+
+    每个ZAP实例一个客户端，新扫描放到实例池中负载最低的实例，之后的请求按handle.endpoint发往扫描所在的实例。
+    """
+    name = "ZAP"
+
+    def __init__(self, config):
+        self.api_key = config["ZAP_API_KEY"]
+        self.primary = config["ZAP_API_URL"]
+        super().__init__(self._create_client(self.primary), concurrency=config["ZAP_ALERT_CONCURRENCY"])
+        self.clients = {self.primary: self.client}
+        self.pool = ZAPPool.from_config(config)
+        self.page_size = config["ZAP_ALERT_PAGE_SIZE"]
+        self.policy_cache_ttl = config["ZAP_POLICY_CACHE_TTL"]
+        self._pending = {}  # task_id -> 本批拉取后的偏移，入库成功后写入
+
+    def _create_client(self, endpoint: str):
+        return create_async_client(endpoint, headers={"X-ZAP-API-Key": self.api_key}, verify=False)
+
+    def _client_for(self, endpoint: str = None):
+        endpoint = endpoint or self.primary
+        if endpoint not in self.clients:
+            self.clients[endpoint] = self._create_client(endpoint)
+        return self.clients[endpoint]
+
+    async def _call(self, path: str, endpoint: str = None, **params):
+        res = await self._request("GET", f"/JSON/{path}/", client=self._client_for(endpoint), params={**params, "apikey": self.api_key})
+        data = res.json()
+        if res.status_code >= 400:
+            raise BadGateway(f"ZAP接口{path}调用失败: {data.get('message', res.text)}")
+        return data
+
+    async def _ensure_policy(self, policy_config, endpoint: str):
+        """按配置指纹复用已下发的扫描策略，仅在首次使用、配置变化或策略丢失（ZAP重启）时重新下发"""
+        name = policy_config["name"]
+        digest = policy_fingerprint(policy_config)
+        key = policy_cache_key(endpoint, name)
+        call = partial(self._call, endpoint=endpoint)
+
+        async def provisioned():
+            if await asyncio.to_thread(redis_client.get, key) != digest.encode():
+                return False
+            if policy_config.get("all_scanners"):
+                # 内置策略在ZAP重启后恢复默认配置但名称仍在，需核对规则的实际状态
+                scanners = (await call("ascan/view/scanners", scanPolicyName=name))["scanners"]
+                return all(
+                    scanner.get("enabled") == "true" and scanner.get("attackStrength") == policy_config["attack_strength"]
+                    for scanner in scanners
                 )
-                self.zap.users.new_user(context_id, "auth_user")
-                self.zap.forcedUser.set_forced_user(context_id, 0)
-                self.zap.forcedUser.set_forced_user_mode_enabled(True)
-            except Exception as e:
-                logger.error(f"ZAP添加自动登录失败: {str(e)}")
-                TaskLog.add_log(task_id, "ERROR", "ZAP添加自动登录失败")
-                return None
+            return name in (await call("ascan/view/scanPolicyNames"))["scanPolicyNames"]
 
+        if await provisioned():
+            return name
+        # 多个worker同时启动扫描时只由一个下发，其余等待后复用
+        lock = RedisLease(f"{key}_lock", ttl=60)
+        if not await asyncio.to_thread(lock.acquire, 30):
+            raise BadGateway(f"ZAP扫描策略{name}下发锁获取失败")
         try:
-            if scan_type == "full":
-                scan_policy_name = "Default Policy"
-                self.zap.ascan.enable_all_scanners()
-                self.zap.ascan.set_policy_attack_strength(scan_policy_name, "HIGH")
+            if await provisioned():
+                return name
+            if policy_config.get("all_scanners"):
+                await call("ascan/action/enableAllScanners", scanPolicyName=name)
+                for category_id in POLICY_CATEGORY_IDS:
+                    await call("ascan/action/setPolicyAttackStrength", id=category_id, attackStrength=policy_config["attack_strength"], scanPolicyName=name)
             else:
-                scan_policy_name = policy_config["name"]
-                # 创建扫描策略
-                self.zap.ascan.add_scan_policy(scan_policy_name)
+                if name in (await call("ascan/view/scanPolicyNames"))["scanPolicyNames"]:
+                    await call("ascan/action/removeScanPolicy", scanPolicyName=name)
+                await call("ascan/action/addScanPolicy", scanPolicyName=name)
                 scanners = policy_config.get("scanners", [])
-                dependencies = policy_config.get("dependencies", [])
-
-                for sid in dependencies:
-                    self.zap.ascan.enable_scanners(scanpolicyname=scan_policy_name, ids=str(sid))
+                ids = ",".join(str(sid) for sid in policy_config.get("dependencies", []) + scanners)
+                await call("ascan/action/enableScanners", ids=ids, scanPolicyName=name)
                 for sid in scanners:
-                    self.zap.ascan.enable_scanners(scanpolicyname=scan_policy_name, ids=str(sid))
                     if "attack_strength" in policy_config:
-                        self.zap.ascan.set_scanner_attack_strength(
-                            id=str(sid),
-                            attackstrength=policy_config["attack_strength"],
-                            scanpolicyname=scan_policy_name
-                        )
-                    self.zap.ascan.set_scanner_alert_threshold(
-                        id=str(sid),
-                        alertthreshold=policy_config["alert_threshold"],
-                        scanpolicyname=scan_policy_name
-                    )
-
-            self.zap.urlopen(target_url)
-            self.zap.core.access_url(target_url, followredirects=True)
-            
-            scan_id = self.zap.ascan.scan(
-                url=target_url,
-                recurse=True,
-                inscopeonly=False,
-                scanpolicyname=scan_policy_name
-            )
-            if not scan_id.isdigit():
-                TaskLog.add_log(task_id, "ERROR", f"ZAP扫描启动失败: {scan_id}")
-                return None
-            TaskLog.add_log(task_id, "INFO", f"ZAP扫描已启动: scan_id={scan_id}")
-            return scan_id
-        except Exception as e:
-            logger.error(f"ZAP扫描启动失败: {str(e)}")
-            TaskLog.add_log(task_id, "ERROR", "ZAP扫描启动失败")
-            return None
+                        await call("ascan/action/setScannerAttackStrength", id=str(sid), attackStrength=policy_config["attack_strength"], scanPolicyName=name)
+                    await call("ascan/action/setScannerAlertThreshold", id=str(sid), alertThreshold=policy_config["alert_threshold"], scanPolicyName=name)
+            await asyncio.to_thread(redis_client.set, key, digest, ex=self.policy_cache_ttl)
+            logger.info(f"ZAP扫描策略{name}已下发({digest[:8]})")
+            return name
+        finally:
+            await asyncio.to_thread(lock.release)
 
-    def stop_scan(self, scan_id: str):
+    async def start(self, task):
+        """扫描类型没有对应的ZAP策略时不启动，返回None"""
+        policy_config = SCAN_POLICIES.get(task.scan_type)
+        if not policy_config:
+            return None
+        endpoint = await asyncio.to_thread(self.pool.reserve, task.zap_endpoint)
         try:
-            result = self.zap.ascan.stop(scan_id)
-            if result != "OK":
-                logger.error(f"停止ZAP扫描失败: {result}")
-                return False
-            return True
-        except Exception as e:
-            logger.error(f"停止ZAP扫描异常: {str(e)}")
-            return False
+            scan_id = await self._start_on(endpoint, task, policy_config)
+        finally:
+            await asyncio.to_thread(self.pool.release, endpoint)
+        return ScanHandle(task.task_id, str(scan_id), task.target_url, endpoint)
 
-    def get_scan_progress(self, scan_id):
-        try:
-            return self.zap.ascan.status(scan_id)
-        except Exception as e:
-            logger.error(f"获取扫描进度失败: {str(e)}")
-            return "does_not_exist"
+    async def _start_on(self, endpoint: str, task, policy_config):
+        call = partial(self._call, endpoint=endpoint)
+        parsed_url = urlparse(task.target_url)
+        context_name = f"ScanContext_{task.task_id}"
+        context_id = (await call("context/action/newContext", contextName=context_name))["contextId"]
+        await call("context/action/includeInContext", contextName=context_name, regex=f"^{parsed_url.scheme}://{re.escape(parsed_url.netloc)}/.*")
+        await call("context/action/setContextInScope", contextName=context_name, booleanInScope="true")
 
-    def get_alerts(self, task_id, url):
-        try:
-            alerts = self.zap.core.alerts(baseurl=url)
-            return alerts
-        except Exception as e:
-            TaskLog.add_log(task_id, "ERROR", f"获取ZAP扫描结果失败: {str(e)}")
-            raise InternalServerError(f"获取ZAP扫描结果失败: {str(e)}")
+        if task.login_info:
+            login_infos = task.login_info.split(",")
+            await call(
+                "authentication/action/setAuthenticationMethod",
+                contextId=context_id,
+                authMethodName="formBasedAuthentication",
+                authMethodConfigParams=f"loginUrl={login_infos[0]}&usernameParam={login_infos[1]}&passwordParam={login_infos[2]}",
+            )
+            user_id = (await call("users/action/newUser", contextId=context_id, name="auth_user"))["userId"]
+            await call("forcedUser/action/setForcedUser", contextId=context_id, userId=user_id)
+            await call("forcedUser/action/setForcedUserModeEnabled", boolean="true")
 
-    def save_vuls(self, task_id, scan_id, url):
-        try:
-            alerts = self.get_alerts(task_id, url)
-            print(f"ZAP漏洞详情：{alerts}")
-            
-            vul_list = self._parse_vulnerability(alerts)
-            if vul_list:
-                VulService._save_results(task_id, vul_list)
-
-            result = self.get_scan_progress(scan_id)
-            if result == "does_not_exist" or result == "unknown":
-                TaskLog.add_log(task_id, "ERROR", f"获取ZAP任务状态失败")
+        policy_name = await self._ensure_policy(policy_config, endpoint)
+
+        await call("core/action/accessUrl", url=task.target_url, followRedirects="true")
+        return (await call("ascan/action/scan", url=task.target_url, recurse="true", inScopeOnly="false", scanPolicyName=policy_name))["scan"]
+
+    async def poll(self, handle):
+        res = await self._request(
+            "GET", "/JSON/ascan/view/status/", client=self._client_for(handle.endpoint),
+            params={"scanId": handle.scan_id, "apikey": self.api_key},
+        )
+        if res.status_code >= 400:
+            # 扫描已不存在（如ZAP重启）时视为结束；5xx与连接异常由_request抛出，跟踪时稍后重试
+            logger.error(f"获取ZAP任务{handle.scan_id}状态失败: HTTP {res.status_code}: {res.text}")
+            return ScanStatus(None, True)
+        progress = int(res.json()["status"])
+        return ScanStatus(progress, progress >= 100)
+
+    async def fetch_results_delta(self, handle):
+        """从偏移处按页拉取目标URL下的新告警（每页一次core/view/alerts请求），只保留本次扫描产生的告警"""
+        offset = await asyncio.to_thread(load_alert_offset, handle.task_id)
+        position = offset
+        alerts = []
+        while True:
+            page = (await self._call(
+                "core/view/alerts", handle.endpoint,
+                baseurl=handle.target_url, start=str(position), count=str(self.page_size),
+            ))["alerts"]
+            position += len(page)
+            alerts += page
+            if len(page) < self.page_size:
+                break
+        if position == offset:
+            return []
+        # 在拉取告警之后读取扫描的告警ID，已拉到的本扫描告警一定在其中
+        scan_alert_ids = set((await self._call("ascan/view/alertsIds", handle.endpoint, scanId=handle.scan_id))["alertsIds"])
+        alerts = [alert for alert in alerts if alert.get("id") in scan_alert_ids]
+        if not alerts:
+            # 没有需要入库的告警，直接推进偏移
+            await asyncio.to_thread(save_alert_offset, handle.task_id, position)
+            return []
+        self._pending[handle.task_id] = position
+        return parse_alerts(alerts)
+
+    def commit_results(self, handle, vuls):
+        super().commit_results(handle, vuls)
+        if handle.task_id in self._pending:
+            save_alert_offset(handle.task_id, self._pending.pop(handle.task_id))
+
+    async def stop(self, handle):
+        return (await self._call("ascan/action/stop", handle.endpoint, scanId=handle.scan_id)).get("Result") == "OK"
+
+    async def health(self):
+        """任一实例可用即可放置新扫描"""
+        for endpoint in self.pool.endpoints:
+            try:
+                await self._call("core/view/version", endpoint)
                 return True
-            if int(result) < 100:
-                return False
-            return True
-        except Exception as e:
-            TaskLog.add_log(task_id, "ERROR", f"保存ZAP漏洞失败: {str(e)}")
-            raise InternalServerError(f"保存ZAP漏洞失败: {str(e)}")
-        
-    def _parse_vulnerability(self, data):
-        vul_list = []
-        severity_map = {
-            "0": "info",
-            "1": "low",
-            "2": "medium", 
-            "3": "high",
-            "4": "critical",
-        }
-        for alert in data:
-            vul = Vulnerability(
-                scan_id=alert.get("id"),
-                scan_source="ZAP",
-                vul_type=alert.get("name"),
-                severity=severity_map.get(alert.get("risk"), "info"),
-                description=alert.get("description"),
-                details=alert.get("solution"),
-                solution=alert.get("reference"),
-                time=datetime.now().replace(tzinfo=timezone.utc),  # 使用UTC时间
-            )
-            vul_list.append(vul)
-        return vul_list
\ No newline at end of file
+            except Exception:
+                continue
+        return False
+
+    async def aclose(self):
+        await asyncio.gather(*(client.aclose() for client in self.clients.values()))
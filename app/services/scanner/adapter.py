@@ -0,0 +1,205 @@
+"""扫描器统一适配接口与异步驱动：单个事件循环并发跟踪多个扫描，不再为每个阻塞调用占用一个线程"""
+import asyncio
+from abc import ABC, abstractmethod
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional
+from flask import current_app
+import httpx
+import redis
+from app.models.vulnerability import Vulnerability
+from app.services.vul import VulService
+from app.utils.exceptions import BadGateway
+from app.utils.http_session import EndpointMetrics, RateLimiter, endpoint_template
+from app.utils.poll_policy import poll_policy
+
+logger = logging.getLogger(__name__)
+
+# 幂等请求遇到以下状态码或连接异常时在_request内按指数退避重试
+RETRY_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+# 跟踪扫描时视为暂时性的异常：扫描器5xx、超时与连接中断、Redis连接异常，在后续周期重试
+TRANSIENT_ERRORS = (BadGateway, httpx.TransportError, redis.exceptions.ConnectionError)
+
+
+class ScanHandle(NamedTuple):
+    task_id: int
+    scan_id: str
+    target_url: str
+    endpoint: Optional[str] = None  # 扫描器有多个实例时扫描所在的实例
+
+
+class ScanStatus(NamedTuple):
+    progress: Optional[int]
+    finished: bool
+
+
+def create_async_client(base_url: str, headers: dict = None, timeout: float = 30, max_connections: int = 20, verify: bool = True):
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        timeout=timeout,
+        verify=verify,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+    )
+
+
+class ScannerAdapter(ABC):
+    """扫描器适配接口：start/poll/fetch_results_delta/stop/health均为协程，commit_results为阻塞的入库操作"""
+    name = ""
+
+    @abstractmethod
+    async def start(self, task) -> Optional[ScanHandle]:
+        """为ScanTask启动扫描，失败返回None"""
+
+    @abstractmethod
+    async def poll(self, handle: ScanHandle) -> ScanStatus:
+        """查询扫描进度"""
+
+    @abstractmethod
+    async def fetch_results_delta(self, handle: ScanHandle) -> List[Vulnerability]:
+        """拉取上次提交以来新增或变化的漏洞"""
+
+    def commit_results(self, handle: ScanHandle, vuls: List[Vulnerability]):
+        """入库并推进增量水位（阻塞，由驱动在线程中串行调用）"""
+        VulService._save_results(handle.task_id, vuls)
+
+    @abstractmethod
+    async def stop(self, handle: ScanHandle) -> bool:
+        """停止扫描"""
+
+    @abstractmethod
+    async def health(self) -> bool:
+        """扫描器服务是否可用"""
+
+    async def aclose(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+
+class HttpScannerAdapter(ScannerAdapter):
+    """基于httpx.AsyncClient的适配器基类，用信号量限制对同一扫描器的并发请求数
+
+    幂等请求失败时最多重试retries次，间隔backoff * 2^n秒；rate_limiter给出时每次请求（含重试）先取令牌；
+    metrics_key给出时请求耗时计入与同步会话相同的Redis统计。
+    """
+
+    def __init__(self, client, concurrency: int = 8, metrics_key: str = None, retries: int = 3, backoff: float = 0.5, rate_limiter: RateLimiter = None):
+        self.client = client
+        self._semaphore = asyncio.Semaphore(max(concurrency, 1))
+        self.rate_limiter = rate_limiter
+        self.endpoint_metrics = EndpointMetrics(metrics_key) if metrics_key else None
+        self.retries = retries
+        self.backoff = backoff
+
+    async def _request(self, method: str, path: str, client=None, **kwargs):
+        retries = self.retries if method.upper() in RETRY_METHODS else 0
+        for attempt in range(retries + 1):
+            try:
+                response = await self._send(method, path, client or self.client, **kwargs)
+            except httpx.TransportError:
+                if attempt == retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    break
+            # 退避等待不占用并发名额
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+        if response.status_code >= 500:
+            raise BadGateway(f"{self.name}接口异常: HTTP {response.status_code}")
+        return response
+
+    async def _send(self, method: str, path: str, client, **kwargs):
+        if self.rate_limiter:
+            await self.rate_limiter.acquire_async()
+        async with self._semaphore:
+            start = time.perf_counter()
+            failed = True
+            try:
+                response = await client.request(method, path, **kwargs)
+                failed = response.status_code >= 500
+            finally:
+                await self._observe(method, path, start, failed)
+        return response
+
+    async def _observe(self, method: str, path: str, start: float, failed: bool):
+        if not self.endpoint_metrics:
+            return
+        pending = self.endpoint_metrics.observe(endpoint_template(method, path), (time.perf_counter() - start) * 1000, failed)
+        if pending:
+            await asyncio.to_thread(self.endpoint_metrics.flush, pending)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class ScanDriver:
+    """用一个事件循环跟踪多个扫描：轮询进度、拉取增量并入库，按自适应策略安排下一次轮询"""
+
+    def __init__(self, adapter: ScannerAdapter, app=None):
+        self.adapter = adapter
+        self.app = app or current_app._get_current_object()
+        self.policy = poll_policy(adapter.name, self.app.config)
+        self.max_failures = self.app.config["SCAN_FOLLOWER_MAX_FAILURES"]
+        # 入库共用数据库会话，串行执行
+        self._db_lock = asyncio.Lock()
+
+    def _commit_sync(self, handle: ScanHandle, vuls: List[Vulnerability]):
+        with self.app.app_context():
+            self.adapter.commit_results(handle, vuls)
+
+    async def _cycle(self, handle: ScanHandle) -> ScanStatus:
+        # 先查进度再拉取结果，进度已完成时本次拉取即包含全部结果
+        status = await self.adapter.poll(handle)
+        vuls = await self.adapter.fetch_results_delta(handle)
+        if vuls:
+            async with self._db_lock:
+                await asyncio.to_thread(self._commit_sync, handle, vuls)
+        return status
+
+    async def follow(self, handle: ScanHandle) -> bool:
+        """跟踪到扫描结束返回True；轮询次数超限或连续max_failures次暂时性异常后返回False"""
+        failures = 0
+        while True:
+            try:
+                status = await self._cycle(handle)
+                # 轮询状态保存在Redis中，阻塞调用放到线程中执行，避免阻塞事件循环
+                delay = await asyncio.to_thread(self.policy.record, handle.task_id, status.progress)
+            except TRANSIENT_ERRORS as e:
+                # 未入库的增量不推进偏移/水位，下个周期重新拉取
+                failures += 1
+                if failures >= self.max_failures:
+                    logger.error(f"任务{handle.task_id} {self.adapter.name}连续{failures}次请求失败，停止跟踪: {str(e)}")
+                    return False
+                delay = min(self.policy.max_interval, self.policy.min_interval * 2 ** failures)
+                logger.warning(f"任务{handle.task_id} {self.adapter.name}请求失败({failures}/{self.max_failures})，{delay:.1f}秒后重试: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+            failures = 0
+            if status.finished:
+                polls = await asyncio.to_thread(self.policy.poll_count, handle.task_id)
+                logger.info(f"任务{handle.task_id} {self.adapter.name}结果同步完成，共轮询{polls}次")
+                return True
+            if await asyncio.to_thread(self.policy.exhausted, handle.task_id):
+                logger.error(f"任务{handle.task_id} {self.adapter.name}轮询次数超过上限")
+                return False
+            await asyncio.sleep(delay)
+
+
+SCANNERS = ("AWVS", "ZAP")
+
+
+def create_adapter(scanner: str, config=None) -> ScannerAdapter:
+    config = config or current_app.config
+    if scanner == "AWVS":
+        from app.services.scanner.AWVS import AsyncAWVSAdapter
+        return AsyncAWVSAdapter(config)
+    if scanner == "ZAP":
+        from app.services.scanner.ZAP import AsyncZAPAdapter
+        return AsyncZAPAdapter(config)
+    raise ValueError(f"不支持的扫描器: {scanner}")
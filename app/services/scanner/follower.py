@@ -0,0 +1,153 @@
+"""扫描跟踪：主节点在一个事件循环中并发跟踪所有运行中的AWVS/ZAP扫描，替代每个扫描一个轮询作业
+
+启动扫描后登记到Redis，跟踪进度（告警偏移、漏洞水位、轮询次数）同样保存在Redis中，
+主节点切换或worker重启后由新的主节点接续；任务的所有扫描结束后投递update_task_status汇总状态。
+跟踪运行在worker主进程spawn出的独立进程中，不继承主进程的数据库/Redis连接，去重模型也只在该进程中加载。
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import threading
+import time
+from typing import Callable, Dict, Tuple
+from app.extensions import redis_client
+from app.services.scanner.adapter import SCANNERS, ScanDriver, ScanHandle, create_adapter
+from app.services.scanner.ZAP import alert_offset_key
+
+logger = logging.getLogger(__name__)
+
+FOLLOW_TASKS_KEY = "scan_follow_tasks"
+
+def _follow_key(task_id) -> str:
+    """任务的扫描登记：{扫描器: 扫描句柄JSON, done_{扫描器}: 1成功/0失败}"""
+    return f"scan_follow_{task_id}"
+
+def register_scans(task_id, handles: Dict[str, ScanHandle], replace: bool = True):
+    """登记任务已启动的扫描，由跟踪主节点接管轮询与入库；replace为False时任务已登记则跳过"""
+    if not handles:
+        return
+    if not replace and redis_client.sismember(FOLLOW_TASKS_KEY, task_id):
+        return
+    key = _follow_key(task_id)
+    with redis_client.pipeline() as pipe:
+        pipe.delete(key)
+        pipe.hset(key, mapping={scanner: json.dumps(handle) for scanner, handle in handles.items()})
+        pipe.sadd(FOLLOW_TASKS_KEY, task_id)
+        pipe.execute()
+
+def unregister_scans(task_id):
+    """任务被停止时取消登记，主节点下次同步时停止跟踪"""
+    with redis_client.pipeline() as pipe:
+        pipe.srem(FOLLOW_TASKS_KEY, task_id)
+        pipe.delete(_follow_key(task_id), alert_offset_key(task_id))
+        pipe.execute()
+
+def registered_scans() -> Dict[Tuple[int, str], ScanHandle]:
+    """尚未结束的已登记扫描 {(task_id, 扫描器): 句柄}"""
+    scans = {}
+    for member in redis_client.smembers(FOLLOW_TASKS_KEY):
+        task_id = int(member)
+        state = {k.decode(): v.decode() for k, v in redis_client.hgetall(_follow_key(task_id)).items()}
+        for scanner in SCANNERS:
+            if scanner in state and f"done_{scanner}" not in state:
+                scans[(task_id, scanner)] = ScanHandle(*json.loads(state[scanner]))
+    return scans
+
+def complete_scan(task_id, scanner: str, ok: bool):
+    """记录单个扫描的结果，任务的所有扫描均结束时投递状态汇总"""
+    from app.services.celery_task.celery_tasks import update_task_status
+    key = _follow_key(task_id)
+    if not redis_client.sismember(FOLLOW_TASKS_KEY, task_id):
+        return
+    redis_client.hset(key, f"done_{scanner}", int(ok))
+    state = {k.decode(): v.decode() for k, v in redis_client.hgetall(key).items()}
+    if any(s in state and f"done_{s}" not in state for s in SCANNERS):
+        return
+    # SREM成功者负责投递，避免重复汇总
+    if not redis_client.srem(FOLLOW_TASKS_KEY, task_id):
+        return
+    redis_client.delete(key, alert_offset_key(task_id))
+    # 结果顺序与update_task_status约定一致：0为AWVS，1为ZAP
+    update_task_status.delay([state.get(f"done_{scanner}") == "1" for scanner in SCANNERS], task_id=task_id)
+
+
+def run_follower(config_name: str):
+    """扫描跟踪进程入口：创建独立的应用与连接，参与主节点选举并运行事件循环"""
+    from app import create_app
+    from app.utils.redis_lock import LeaderElection
+    app = create_app(config_name)
+    election = LeaderElection("scan_follower_leader", ttl=app.config["SCAN_FOLLOWER_LEADER_TTL"])
+    election.start()
+    ScanFollower(
+        app,
+        enabled=lambda: election.is_leader,
+        sync_interval=app.config["SCAN_FOLLOWER_SYNC_INTERVAL"],
+    ).run()
+
+def start_follower_process(config_name: str, restart_delay: float = 5):
+    """以spawn方式启动扫描跟踪进程，进程异常退出后自动重启"""
+    def supervise():
+        context = multiprocessing.get_context("spawn")
+        while True:
+            process = context.Process(target=run_follower, args=(config_name,), name="scan-follower", daemon=True)
+            process.start()
+            process.join()
+            logger.error(f"扫描跟踪进程退出(exitcode={process.exitcode})，{restart_delay}秒后重启")
+            time.sleep(restart_delay)
+
+    threading.Thread(target=supervise, name="scan-follower-supervisor", daemon=True).start()
+
+
+class ScanFollower:
+    """运行一个事件循环，仅在enabled()为真（主节点）时跟踪已登记的扫描"""
+
+    def __init__(self, app, enabled: Callable[[], bool] = None, sync_interval: float = 5.0):
+        self.app = app
+        self.enabled = enabled or (lambda: True)
+        self.sync_interval = sync_interval
+        self._follows: Dict[Tuple[int, str], asyncio.Task] = {}
+
+    def run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        adapters = {scanner: create_adapter(scanner, self.app.config) for scanner in SCANNERS}
+        self.drivers = {scanner: ScanDriver(adapter, self.app) for scanner, adapter in adapters.items()}
+        logger.info("扫描跟踪已启动")
+        try:
+            while True:
+                try:
+                    await self._sync()
+                except Exception as e:
+                    logger.error(f"扫描跟踪同步异常: {str(e)}")
+                await asyncio.sleep(self.sync_interval)
+        finally:
+            await asyncio.gather(*(adapter.aclose() for adapter in adapters.values()))
+
+    async def _sync(self):
+        if not self.enabled():
+            # 失去主节点身份时停止跟踪，由新的主节点从Redis接续
+            for follow in self._follows.values():
+                follow.cancel()
+            return
+        scans = await asyncio.to_thread(registered_scans)
+        for key, follow in self._follows.items():
+            if key not in scans:
+                follow.cancel()
+        for key, handle in scans.items():
+            if key not in self._follows:
+                self._follows[key] = asyncio.create_task(self._follow(*key, handle))
+
+    async def _follow(self, task_id, scanner: str, handle: ScanHandle):
+        try:
+            try:
+                ok = await self.drivers[scanner].follow(handle)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"任务{task_id} {scanner}跟踪失败: {str(e)}")
+                ok = False
+            await asyncio.to_thread(complete_scan, task_id, scanner, ok)
+        finally:
+            self._follows.pop((task_id, scanner), None)
@@ -0,0 +1,118 @@
+"""ZAP守护进程池：新的主动扫描放到负载最低的实例上，负载按运行中扫描数与排队扫描数计算"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import logging
+from typing import Dict, List, Optional
+import requests
+from app.extensions import redis_client
+from app.utils.exceptions import BadGateway
+from app.utils.redis_lock import RedisLease
+
+logger = logging.getLogger(__name__)
+
+# ascan/view/scans中尚未开始或被暂停的扫描视为排队
+QUEUED_STATES = ("NOT_STARTED", "PAUSED")
+PLACEMENT_LOCK = "zap_placement_lock"
+
+
+class ZAPPool:
+    """按实例统计负载并选择放置节点
+
+    负载 = 运行中扫描数 + 排队扫描数 + 已选定但尚未启动的扫描数（Redis计数），
+    后者避免并发创建的多个任务在扫描出现在ZAP之前全部落到同一实例；
+    探测、选择与占用名额在同一把短租约锁内完成，并发放置看到的负载已包含彼此的占用。
+    """
+
+    def __init__(self, endpoints: List[str], api_key: str, reserve_ttl: int = 120, probe_timeout: float = 5):
+        if not endpoints:
+            raise ValueError("ZAP实例列表为空")
+        self.endpoints = endpoints
+        self.api_key = api_key
+        self.reserve_ttl = reserve_ttl
+        # 不可达实例的探测耗时直接决定放置锁的持有时间
+        self.probe_timeout = probe_timeout
+
+    @classmethod
+    def from_config(cls, config) -> "ZAPPool":
+        return cls(config["ZAP_API_URLS"], config["ZAP_API_KEY"], config["ZAP_PLACEMENT_RESERVE_TTL"])
+
+    @staticmethod
+    def _reserved_key(endpoint: str) -> str:
+        return f"zap_reserved_{endpoint}"
+
+    def _probe(self, endpoint: str) -> Optional[dict]:
+        """查询单个实例的扫描队列，不可达时返回None"""
+        try:
+            res = requests.get(
+                f"{endpoint}/JSON/ascan/view/scans/",
+                params={"apikey": self.api_key},
+                headers={"X-ZAP-API-Key": self.api_key},
+                timeout=self.probe_timeout,
+                verify=False,
+            )
+            scans = res.json().get("scans")
+        except Exception as e:
+            logger.warning(f"ZAP实例{endpoint}不可用: {str(e)}")
+            return None
+        if not isinstance(scans, list):
+            logger.warning(f"ZAP实例{endpoint}返回异常: {scans}")
+            return None
+        running = sum(scan.get("state") == "RUNNING" for scan in scans)
+        queued = sum(scan.get("state") in QUEUED_STATES for scan in scans)
+        reserved = int(redis_client.get(self._reserved_key(endpoint)) or 0)
+        return {"running": running, "queued": queued, "reserved": reserved}
+
+    def loads(self) -> Dict[str, Optional[dict]]:
+        """并发探测所有实例的负载"""
+        with ThreadPoolExecutor(max_workers=len(self.endpoints), thread_name_prefix="zap-probe") as pool:
+            return dict(zip(self.endpoints, pool.map(self._probe, self.endpoints)))
+
+    def select(self) -> str:
+        """选出负载最低的可用实例，负载相同时优先排队少的，再按配置顺序"""
+        loads = self.loads()
+        candidates = [
+            (load["running"] + load["queued"] + load["reserved"], load["queued"], index, endpoint)
+            for index, (endpoint, load) in enumerate(loads.items()) if load is not None
+        ]
+        if not candidates:
+            raise BadGateway("没有可用的ZAP实例")
+        endpoint = min(candidates)[-1]
+        logger.info(f"ZAP扫描放置到{endpoint}，各实例负载: {loads}")
+        return endpoint
+
+    def _occupy(self, endpoint: str):
+        key = self._reserved_key(endpoint)
+        with redis_client.pipeline() as pipe:
+            pipe.incr(key)
+            pipe.expire(key, self.reserve_ttl)
+            pipe.execute()
+
+    def reserve(self, endpoint: str = None) -> str:
+        """选定实例（或使用任务已记录的实例）并占用一个名额，扫描启动后需调用release"""
+        if endpoint:
+            self._occupy(endpoint)
+            return endpoint
+        lock = RedisLease(PLACEMENT_LOCK, ttl=self.probe_timeout * 2 + 5)
+        if not lock.acquire(blocking_timeout=self.probe_timeout * 4 + 10):
+            raise BadGateway("ZAP实例放置锁获取失败")
+        try:
+            endpoint = self.select()
+            self._occupy(endpoint)
+        finally:
+            lock.release()
+        return endpoint
+
+    def release(self, endpoint: str):
+        """扫描已启动（此时已计入ZAP自身队列）或启动失败后释放名额"""
+        key = self._reserved_key(endpoint)
+        # 计数已过期时DECR会得到负数，直接删除
+        if redis_client.decr(key) < 0:
+            redis_client.delete(key)
+
+    @contextmanager
+    def place(self, endpoint: str = None):
+        endpoint = self.reserve(endpoint)
+        try:
+            yield endpoint
+        finally:
+            self.release(endpoint)
@@ -1,17 +1,22 @@
 """任务管理"""
-from celery import chain, chord, group
+import asyncio
+from typing import Dict
 from flask import g, current_app
 import requests
 from sqlalchemy import func, or_
 from app.models.scan_task import ScanTask
-from app.extensions import db
+from app.extensions import db, redis_client
 from app.models.task_log import TaskLog
 from app.models.user import User
 from sqlalchemy.orm import joinedload
+from uuid import uuid4
 from app.services.celery_task.celery_tasks import *
 from app.services.scanner.Xray import Xray
 from app.utils.exceptions import AppException, ValidationError, Forbidden, InternalServerError, NotFound, Unauthorized
+from app.utils.validation import InputValidator
 from app.services.scanner.AWVS import AWVS
+from app.services.scanner.adapter import SCANNERS, ScanHandle, create_adapter
+from app.services.scanner.follower import register_scans, unregister_scans
 from celery.result import AsyncResult
 
 class TaskService:
@@ -51,6 +56,77 @@ class TaskService:
             db.session.rollback()
             raise InternalServerError(f"创建任务失败: {e} ")
         
+    @staticmethod
+    def bulk_create_tasks(user_id: int, items: list):
+        """批量创建任务：校验后一次性写入任务记录，AWVS目标注册交给后台作业，返回作业ID"""
+        if not items:
+            raise ValidationError("任务列表不能为空")
+        max_size = current_app.config["TASK_BULK_MAX"]
+        if len(items) > max_size:
+            raise ValidationError(f"单次最多创建{max_size}个任务")
+
+        # 入库与投递前逐项校验，错误信息给出序号
+        scan_types = ScanTask.scan_type.type.enums
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise ValidationError(f"第{index}项任务格式错误，应为对象")
+            if not isinstance(item.get("task_name"), str) or not item["task_name"]:
+                raise ValidationError(f"第{index}项任务名称不能为空")
+            if not isinstance(item.get("target_url"), str) or not InputValidator.validate_url(item["target_url"]):
+                raise ValidationError(f"第{index}项无效url: {item.get('target_url')}")
+            if item.get("login_url") and not (isinstance(item["login_url"], str) and InputValidator.validate_url(item["login_url"])):
+                raise ValidationError(f"第{index}项无效登录url: {item['login_url']}")
+            if item.get("scan_type", "full") not in scan_types:
+                raise ValidationError(f"第{index}项扫描类型无效: {item.get('scan_type')}，可选值: {', '.join(scan_types)}")
+
+        names = [item["task_name"] for item in items]
+        if len(set(names)) != len(names):
+            raise ValidationError("任务名称不能重复")
+        existing = [name for (name,) in db.session.query(ScanTask.task_name).filter(ScanTask.task_name.in_(names))]
+        if existing:
+            raise ValidationError(f"任务名称已存在: {', '.join(existing)}")
+
+        tasks = []
+        for item in items:
+            login_url = item.get("login_url")
+            task = ScanTask(
+                user_id=user_id,
+                task_name=item["task_name"],
+                target_url=item["target_url"],
+                scan_type=item.get("scan_type", "full"),
+            )
+            if login_url:
+                task.login_info = f"{login_url},{item.get('login_username')},{item.get('login_password')}"
+            tasks.append(task)
+
+        try:
+            db.session.add_all(tasks)
+            db.session.commit()
+            # 投递前记录作业归属，查询时先校验归属再读取作业状态
+            job_id = str(uuid4())
+            redis_client.set(f"bulk_job_owner_{job_id}", int(user_id), ex=current_app.config["TASK_BULK_JOB_TTL"])
+            register_awvs_targets.apply_async(args=(int(user_id), [task.task_id for task in tasks]), task_id=job_id)
+            return job_id, tasks
+        except Exception as e:
+            db.session.rollback()
+            raise InternalServerError(f"批量创建任务失败: {e}")
+
+    @staticmethod
+    def get_bulk_job(job_id: str):
+        """查询批量创建作业状态，完成后返回每个任务的结果；仅作业创建者与管理员可查询"""
+        owner = redis_client.get(f"bulk_job_owner_{job_id}")
+        if owner is None:
+            raise NotFound("作业不存在或已过期")
+        if g.current_user.get("role") != "admin" and int(owner) != int(g.current_user.get("user_id")):
+            raise Forbidden("无权限访问此作业")
+        result = AsyncResult(job_id)
+        if result.state == "FAILURE":
+            return {"job_id": job_id, "state": result.state, "error": str(result.result)}
+        if result.state != "SUCCESS":
+            return {"job_id": job_id, "state": result.state}
+        payload = result.result or {}
+        return {"job_id": job_id, "state": result.state, "results": payload.get("results", {})}
+
     def is_url_accessible(task_id, url, timeout=5):
         """判断URL是否可访问。"""
         try:
@@ -160,8 +236,6 @@ class TaskService:
             if task.status != "pending":
                 raise ValidationError("任务状态异常，不可启动！")
 
-            # 创建异步任务组
-            task_group_list = []
             awvs = AWVS()
             if task.scan_type == "full":
                 xray = Xray(
@@ -180,21 +254,22 @@ class TaskService:
             else: 
                 TaskLog.add_log(task_id, "INFO", "该扫描类型不启动Xray")
 
-            awvs_scan_id = awvs.start_scan(task_id, task.awvs_id, task.scan_type)
-            if awvs_scan_id:
-                task_group_list.append(save_awvs_vuls.s(task_id, awvs_scan_id))
-                task.awvs_id = awvs_scan_id
-
-            zap_scan_id = ZAP().start_scan(task_id, task.target_url, task.scan_type, task.login_info)
-            if zap_scan_id:
-                task_group_list.append(save_zap_vuls.s(task_id, zap_scan_id, task.target_url))
-                task.zap_id = zap_scan_id
+            handles = {}
+            for scanner, result in asyncio.run(TaskService._start_scanners(task)).items():
+                # 单个扫描器启动失败不影响其他扫描器
+                if isinstance(result, Exception):
+                    TaskLog.add_log(task_id, "ERROR", f"{scanner}扫描启动失败: {str(result)}")
+                elif result is not None:
+                    handles[scanner] = result
+                    TaskLog.add_log(task_id, "INFO", f"{scanner}扫描已启动: scan_id={result.scan_id}")
+            if "AWVS" in handles:
+                task.awvs_id = handles["AWVS"].scan_id
+            if "ZAP" in handles:
+                task.zap_id = handles["ZAP"].scan_id
+                task.zap_endpoint = handles["ZAP"].endpoint
 
-            # 构建 Celery 任务组并启动
-            task_group = group(task_group_list)
-            async_result = chord(task_group, update_task_status.s(task_id=task_id), task_protocol=2).apply_async()
-            task.celery_group_id = async_result.id
-            task.celery_task_ids = [t.id for t in async_result.parent.results]
+            # 由worker中的扫描跟踪主节点轮询进度并入库，全部结束后更新任务状态
+            register_scans(task_id, handles)
             task.update_status("running")
             db.session.commit()
         except Exception as e:
@@ -204,6 +279,25 @@ class TaskService:
             TaskLog.add_log(task_id, "ERROR", f"启动扫描任务失败：{str(e)}")
             TaskService.stop_scan_task(task_id)
             raise InternalServerError(f"启动扫描任务失败: {str(e)}")
+
+    @staticmethod
+    async def _start_scanners(task) -> Dict[str, object]:
+        """并发启动AWVS与ZAP扫描，返回{扫描器: 扫描句柄、None（该扫描类型不启动）或启动异常}"""
+        async def start(scanner):
+            async with create_adapter(scanner) as adapter:
+                return await adapter.start(task)
+
+        results = await asyncio.gather(*(start(scanner) for scanner in SCANNERS), return_exceptions=True)
+        return dict(zip(SCANNERS, results))
+
+    @staticmethod
+    async def _stop_scanners(handles: Dict[str, ScanHandle]) -> Dict[str, object]:
+        async def stop(scanner, handle):
+            async with create_adapter(scanner) as adapter:
+                return await adapter.stop(handle)
+
+        results = await asyncio.gather(*(stop(scanner, handle) for scanner, handle in handles.items()), return_exceptions=True)
+        return dict(zip(handles, results))
         
     @staticmethod
     def wait_for_port(port, timeout=100):
@@ -229,6 +323,7 @@ class TaskService:
         if task.status == "pending":
             raise ValidationError("任务未在运行中")
     
+        # 升级前启动的任务可能还有排队中的旧轮询作业，一并撤销
         if task.celery_group_id:
             group_result = AsyncResult(task.celery_group_id)
             group_result.revoke(terminate=True, signal='SIGTERM')
@@ -236,12 +331,18 @@ class TaskService:
             for tid in task.celery_task_ids:
                 AsyncResult(tid).revoke(terminate=True, signal='SIGTERM')
 
-        try:
-            AWVS().stop_scan(task.awvs_id)
-        except AppException: raise
-        try:
-            ZAP().stop_scan(task.zap_id)
-        except AppException: raise
+        unregister_scans(task_id)
+        handles = {}
+        if task.awvs_id:
+            handles["AWVS"] = ScanHandle(task_id, task.awvs_id, task.target_url)
+        if task.zap_id:
+            handles["ZAP"] = ScanHandle(task_id, task.zap_id, task.target_url, task.zap_endpoint)
+        # 已取消跟踪，停止失败时仍继续收尾，避免任务停留在运行中
+        for scanner, result in asyncio.run(TaskService._stop_scanners(handles)).items():
+            if isinstance(result, Exception):
+                TaskLog.add_log(task_id, "ERROR", f"停止{scanner}扫描失败: {str(result)}")
+            elif not result:
+                TaskLog.add_log(task_id, "ERROR", f"停止{scanner}扫描失败")
         try:
             xray = Xray(
                 xray_path=current_app.config["XRAY_PATH"],
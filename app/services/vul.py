@@ -1,12 +1,17 @@
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta, timezone
+import json
 from typing import List
 
-from flask import g, render_template
+from flask import current_app, g, render_template
 from flask_mail import Mail
 from sqlalchemy import and_, func, or_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import joinedload
 from app.extensions import db
 from app.models import Vulnerability, ScanTask
+from app.utils.blob_store import BlobStore
 from app.utils.exceptions import AppException, NotFound, InternalServerError, ValidationError
 import logging
 
@@ -110,28 +115,130 @@ class VulService:
         except Exception as e:
             raise InternalServerError(f"获取高风险漏洞数量失败: {str(e)}")
 
+    @staticmethod
+    def get_snapshot(vul_id: int):
+        """按需读取漏洞的请求/响应快照"""
+        try:
+            query = Vulnerability.query.filter_by(vul_id=vul_id)
+            if g.current_user.get("role") != "admin":
+                query = query.filter(Vulnerability.task.has(user_id=int(g.current_user.get("user_id"))))
+            vul = query.first()
+            if not vul:
+                raise NotFound("漏洞不存在")
+            try:
+                details = json.loads(vul.details or "{}")
+            except ValueError:
+                details = {}
+            if not isinstance(details, dict):
+                details = {}
+            # 兼容快照仍内联在details中的历史数据
+            if details.get("snapshot"):
+                return details["snapshot"]
+            if not details.get("snapshot_ref"):
+                raise NotFound("该漏洞没有快照")
+            data = BlobStore(current_app.config["SNAPSHOT_STORE_PATH"]).get(details["snapshot_ref"])
+            if data is None:
+                raise NotFound("快照文件不存在")
+            return data.decode("utf-8")
+        except AppException:
+            raise
+        except Exception as e:
+            raise InternalServerError(f"获取漏洞快照失败: {str(e)}")
+
     @staticmethod
     def _save_results(task_id: int, results: List[Vulnerability]):
-        """保存漏洞结果到数据库"""
+        """保存漏洞结果到数据库，返回(新增数, 更新数)"""
         try:
-            if results[0].scan_source != "XRAY":
-                existing_vuls = db.session.query(Vulnerability).filter_by(task_id=task_id).all()
-                existing_dict = {}
-                for vul in existing_vuls:
-                    if vul.scan_source not in existing_dict:
-                        existing_dict[vul.scan_source] = {}
+            if results[0].scan_source == "XRAY":
+                # Xray按确定性scan_id合并批次内重复上报，已存在的累加命中次数
+                counts = Counter(v.scan_id for v in results)
+                unique_results = []
+                for vul in results:
+                    if vul.scan_id in counts:
+                        vul.hit_count = counts.pop(vul.scan_id)
+                        unique_results.append(vul)
+            else:
+                existing_dict = defaultdict(dict)
+                for vul in db.session.query(Vulnerability).filter_by(task_id=task_id).all():
                     existing_dict[vul.scan_source][vul.scan_id] = vul
 
                 # 初始化去重器并执行去重
                 dedup = VulDeduplicator()
-                unique_results = dedup.deduplicate(results, existing_dict)
-                db.session.add_all(unique_results)
-            db.session.add_all(results)
+                unique_results = dedup.deduplicate(results, existing_dict, task_id)
+
+            inserted, updated = VulService._bulk_upsert(task_id, unique_results)
             db.session.commit()
+            logger.info(f"任务{task_id}漏洞入库: 新增{inserted}条, 更新{updated}条, 去重{len(results) - len(unique_results)}条")
+            return inserted, updated
         except Exception as e:
             db.session.rollback()
             logger.error(f"漏洞保存失败: {str(e)}")
             raise InternalServerError(f"漏洞保存失败: {str(e)}")
+
+    @staticmethod
+    def _refresh_results(task_id: int, vuls: List[Vulnerability]):
+        """按(task_id, scan_source, scan_id)原地更新已入库漏洞在扫描器侧可能变化的字段"""
+        try:
+            for vul in vuls:
+                Vulnerability.query.filter_by(task_id=task_id, scan_source=vul.scan_source, scan_id=vul.scan_id).update({
+                    "vul_type": vul.vul_type,
+                    "url": vul.url,
+                    "severity": vul.severity or "info",
+                    "description": vul.description,
+                    "details": vul.details,
+                    "solution": vul.solution,
+                }, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise InternalServerError(f"漏洞更新失败: {str(e)}")
+
+    @staticmethod
+    def _bulk_upsert(task_id: int, vuls: List[Vulnerability], chunk_size: int = 1000):
+        """以(task_id, scan_source, scan_id)为键多行写入，冲突时累加命中次数，返回(新增数, 更新数)"""
+        if not vuls:
+            return 0, 0
+        columns = [c.name for c in Vulnerability.__table__.columns if c.name != "vul_id"]
+        rows = []
+        for vul in vuls:
+            row = {name: getattr(vul, name) for name in columns}
+            row["task_id"] = row["task_id"] or task_id
+            row["severity"] = row["severity"] or "info"
+            row["time"] = row["time"] or datetime.now()
+            row["hit_count"] = row["hit_count"] or 1
+            rows.append(row)
+
+        # 预先查询已存在的键用于统计（唯一索引查询）
+        existing = set()
+        for row_task_id, source in {(r["task_id"], r["scan_source"]) for r in rows}:
+            scan_ids = [r["scan_id"] for r in rows if r["task_id"] == row_task_id and r["scan_source"] == source]
+            for i in range(0, len(scan_ids), chunk_size):
+                existing.update(db.session.query(Vulnerability.task_id, Vulnerability.scan_source, Vulnerability.scan_id).filter(
+                    Vulnerability.task_id == row_task_id,
+                    Vulnerability.scan_source == source,
+                    Vulnerability.scan_id.in_(scan_ids[i:i + chunk_size]),
+                ).all())
+
+        # 语句只编译一次，按executemany传参；驱动将其改写为多行写入（PyMySQL）或批量执行（SQLite）
+        # 若每块都用.values(chunk)生成多行VALUES，每块都要重新编译上万个绑定参数，比逐对象写入还慢
+        table = Vulnerability.__table__
+        dialect = db.engine.dialect.name
+        if dialect == "mysql":
+            stmt = mysql_insert(table)
+            stmt = stmt.on_duplicate_key_update(hit_count=table.c.hit_count + stmt.inserted.hit_count)
+        elif dialect == "sqlite":
+            stmt = sqlite_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["task_id", "scan_source", "scan_id"],
+                set_={"hit_count": table.c.hit_count + stmt.excluded.hit_count},
+            )
+        else:
+            raise InternalServerError(f"不支持的数据库类型: {dialect}")
+        for i in range(0, len(rows), chunk_size):
+            db.session.execute(stmt, rows[i:i + chunk_size])
+
+        updated = sum(1 for r in rows if (r["task_id"], r["scan_source"], r["scan_id"]) in existing)
+        return len(rows) - updated, updated
         
     def send_alert_email(task_id: int, vulnerabilities: List[Vulnerability]):
         """发送告警邮件"""
@@ -0,0 +1,40 @@
+"""本地内容寻址Blob存储：按SHA-256去重，gzip压缩落盘"""
+import gzip
+import hashlib
+import os
+import re
+from typing import Optional
+
+_DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class BlobStore:
+    """目录结构: {root}/{digest[:2]}/{digest[2:4]}/{digest}.gz，相同内容只存一份"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.gz")
+
+    def put(self, data: bytes) -> str:
+        """写入内容并返回摘要；已存在时直接返回"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+                f.write(data)
+            # 并发写入同一内容时rename原子覆盖，结果一致
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """按摘要读取内容，不存在或摘要非法时返回None"""
+        if not digest or not _DIGEST_PATTERN.match(digest):
+            return None
+        try:
+            with gzip.open(self._path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
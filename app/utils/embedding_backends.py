@@ -0,0 +1,71 @@
+"""语义模型推理后端（torch / torch-int8 / onnx），依赖按需导入"""
+import logging
+import os
+from typing import List
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx")
+
+class OnnxSentenceEncoder:
+    """基于ONNX Runtime的CPU推理，均值池化与sentence-transformers原实现一致，无需加载torch"""
+
+    def __init__(self, model_dir: str, onnx_file: str = "onnx/model.onnx", max_seq_length: int = 128, num_threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, onnx_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences: List[str], batch_size: int = 64, convert_to_numpy: bool = True, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(list(sentences[start:start + batch_size]))
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # 均值池化（忽略padding）
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            outputs.append(pooled.astype(np.float32))
+
+        vectors = np.concatenate(outputs) if outputs else np.zeros((0, 0), dtype=np.float32)
+        if normalize_embeddings and len(vectors):
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+
+def load_embedding_model(model_path: str, backend: str = "torch", num_threads: int = 0):
+    """按后端加载模型，返回对象均提供与SentenceTransformer.encode一致的接口"""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}")
+
+    if backend == "onnx":
+        return OnnxSentenceEncoder(model_path, num_threads=num_threads)
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    model = SentenceTransformer(model_path, device="cpu" if backend == "torch-int8" else None)
+    if backend == "torch-int8":
+        # 动态量化线性层，权重int8，激活运行时量化
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    logger.info(f"语义模型已加载: backend={backend}")
+    return model
@@ -0,0 +1,203 @@
+"""独立向量编码服务（Unix Socket），由单个模型实例合并各worker的并发请求批量编码"""
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import List
+import numpy as np
+from app.utils.exceptions import InternalServerError
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf"))
+
+def _send_frame(sock: socket.socket, header: dict, payload: bytes = b""):
+    """帧格式: 4字节头长度 + JSON头 + 原始数据（长度由头中的nbytes给出）"""
+    data = json.dumps({**header, "nbytes": len(payload)}).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data + payload)
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("连接已关闭")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def _recv_frame(sock: socket.socket):
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    header = json.loads(_recv_exact(sock, length))
+    payload = _recv_exact(sock, header.get("nbytes", 0))
+    return header, payload
+
+
+class _EncodeRequest:
+    __slots__ = ("texts", "enqueued_at", "done", "vectors", "error")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.vectors = None
+        self.error = None
+
+
+class EmbeddingServer:
+    """持有唯一模型实例，将短时间窗口内的请求合并为微批次编码"""
+
+    def __init__(self, model, socket_path: str, max_batch: int = 256, max_wait_ms: float = 10, batch_size: int = 64):
+        self.model = model
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[_EncodeRequest]" = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "requests": 0,
+            "texts": 0,
+            "batches": 0,
+            "errors": 0,
+            "encode_seconds": 0.0,
+            "latency_ms": [0] * len(LATENCY_BUCKETS_MS),
+        }
+
+    def encode(self, texts: List[str], timeout: float = 120) -> np.ndarray:
+        request = _EncodeRequest(texts)
+        self._queue.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError("编码请求超时")
+        if request.error:
+            raise RuntimeError(request.error)
+        return request.vectors
+
+    def stats(self) -> dict:
+        with self._metrics_lock:
+            metrics = {**self._metrics, "latency_ms": list(self._metrics["latency_ms"])}
+        metrics["queue_depth"] = self._queue.qsize()
+        metrics["avg_batch_texts"] = metrics["texts"] / metrics["batches"] if metrics["batches"] else 0
+        metrics["latency_buckets_ms"] = [str(b) for b in LATENCY_BUCKETS_MS]
+        return metrics
+
+    def _collect_batch(self) -> List[_EncodeRequest]:
+        """阻塞等待首个请求，随后在max_wait内继续收集直到达到max_batch条文本"""
+        batch = [self._queue.get()]
+        count = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            count += len(request.texts)
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [t for r in batch for t in r.texts]
+            start = time.monotonic()
+            try:
+                vectors = np.asarray(self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True), dtype=np.float32)
+                offset = 0
+                for request in batch:
+                    request.vectors = vectors[offset:offset + len(request.texts)]
+                    offset += len(request.texts)
+            except Exception as e:
+                logger.error(f"批量编码失败: {str(e)}")
+                for request in batch:
+                    request.error = str(e)
+            finished = time.monotonic()
+
+            with self._metrics_lock:
+                self._metrics["batches"] += 1
+                self._metrics["requests"] += len(batch)
+                self._metrics["texts"] += len(texts)
+                self._metrics["encode_seconds"] += finished - start
+                if any(r.error for r in batch):
+                    self._metrics["errors"] += len(batch)
+                for request in batch:
+                    latency = (finished - request.enqueued_at) * 1000
+                    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                        if latency <= bound:
+                            self._metrics["latency_ms"][i] += 1
+                            break
+            for request in batch:
+                request.done.set()
+
+    def serve_forever(self):
+        server_ref = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                try:
+                    header, _ = _recv_frame(self.request)
+                    op = header.get("op")
+                    if op == "encode":
+                        vectors = server_ref.encode(header.get("texts", []))
+                        _send_frame(self.request, {"shape": list(vectors.shape)}, vectors.astype("<f4").tobytes())
+                    elif op == "stats":
+                        _send_frame(self.request, {"stats": server_ref.stats()})
+                    else:
+                        _send_frame(self.request, {"error": f"未知操作: {op}"})
+                except ConnectionError:
+                    pass
+                except Exception as e:
+                    try:
+                        _send_frame(self.request, {"error": str(e)})
+                    except OSError:
+                        pass
+
+        class Server(socketserver.ThreadingUnixStreamServer):
+            daemon_threads = True
+            request_queue_size = 256  # 多worker并发连接时避免积压被拒
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        with Server(self.socket_path, Handler) as server:
+            os.chmod(self.socket_path, 0o660)
+            logger.info(f"向量编码服务已启动: {self.socket_path}")
+            server.serve_forever()
+
+
+class EmbeddingClient:
+    """编码服务客户端，encode接口与SentenceTransformer.encode保持一致"""
+
+    def __init__(self, socket_path: str, timeout: float = 120):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _request(self, header: dict):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            _send_frame(sock, header)
+            response, payload = _recv_frame(sock)
+        if "error" in response:
+            raise InternalServerError(f"向量编码服务异常: {response['error']}")
+        return response, payload
+
+    def encode(self, sentences: List[str], batch_size: int = 64, convert_to_numpy: bool = True, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        response, payload = self._request({"op": "encode", "texts": list(sentences)})
+        vectors = np.frombuffer(payload, dtype="<f4").reshape(response["shape"]).copy()
+        if normalize_embeddings and len(vectors):
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.maximum(norms, 1e-12)
+        return vectors
+
+    def stats(self) -> dict:
+        response, _ = self._request({"op": "stats"})
+        return response["stats"]
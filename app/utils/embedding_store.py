@@ -0,0 +1,78 @@
+"""漏洞描述向量持久化存储"""
+from hashlib import md5
+import logging
+from typing import Dict, List
+import numpy as np
+from sqlalchemy import insert
+from app.extensions import db
+from app.models.vul_embedding import VulEmbedding
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingStore:
+    """按文本内容哈希缓存向量，只对数据库中不存在的文本调用模型编码"""
+    QUERY_CHUNK = 500  # IN 查询分块大小，避免单条SQL过长
+
+    def __init__(self, model, model_tag: str, batch_size: int = 64):
+        self.model = model
+        self.model_tag = model_tag
+        self.batch_size = batch_size
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return md5(text.encode("utf-8")).hexdigest()
+
+    def get(self, texts: List[str]) -> np.ndarray:
+        """返回与texts顺序一致的归一化float32向量矩阵"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        hashes = [self.content_hash(t) for t in texts]
+        vectors = self._load(set(hashes))
+
+        # 仅编码库中不存在的文本（同批次重复文本只编码一次）
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in vectors and h not in missing:
+                missing[h] = t
+        if missing:
+            encoded = self.model.encode(
+                list(missing.values()),
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            ).astype(np.float32)
+            new_vectors = dict(zip(missing.keys(), encoded))
+            self._persist(new_vectors)
+            vectors.update(new_vectors)
+            logger.debug(f"向量缓存命中{len(set(hashes)) - len(missing)}条, 新编码{len(missing)}条")
+
+        return np.stack([vectors[h] for h in hashes])
+
+    def _load(self, hashes: set) -> Dict[str, np.ndarray]:
+        """批量读取已持久化的向量"""
+        result = {}
+        hash_list = list(hashes)
+        for i in range(0, len(hash_list), self.QUERY_CHUNK):
+            rows = db.session.query(VulEmbedding.content_hash, VulEmbedding.vector).filter(
+                VulEmbedding.model == self.model_tag,
+                VulEmbedding.content_hash.in_(hash_list[i:i + self.QUERY_CHUNK]),
+            ).all()
+            for content_hash, vector in rows:
+                result[content_hash] = np.frombuffer(vector, dtype="<f4")
+        return result
+
+    def _persist(self, vectors: Dict[str, np.ndarray]):
+        """批量写入新向量，并发worker写入相同哈希时忽略冲突"""
+        rows = [{
+            "content_hash": h,
+            "model": self.model_tag,
+            "dim": int(v.shape[0]),
+            "vector": v.astype("<f4").tobytes(),
+        } for h, v in vectors.items()]
+        ignore_prefix = "OR IGNORE" if db.engine.dialect.name == "sqlite" else "IGNORE"
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(VulEmbedding).prefix_with(ignore_prefix), rows)
+        except Exception as e:
+            # 缓存写入失败不影响去重结果
+            logger.warning(f"向量缓存写入失败: {str(e)}")
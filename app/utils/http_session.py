@@ -0,0 +1,198 @@
+"""扫描器API共用的HTTP会话：连接池复用、默认超时、幂等请求退避重试，并按端点统计耗时直方图
+
+扫描器请求主要发生在Celery worker中，统计增量定期汇总到Redis哈希，Web进程从Redis读取各进程的合计值。
+"""
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.extensions import redis_client
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+# UUID、纯数字及长十六进制路径段视为资源ID，归并到同一端点
+_ID_SEGMENT = re.compile(r"^([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|\d+|[0-9a-fA-F]{16,})$")
+
+def endpoint_template(method: str, url: str) -> str:
+    path = "/".join("{id}" if _ID_SEGMENT.match(seg) else seg for seg in urlsplit(url).path.split("/"))
+    return f"{method.upper()} {path}"
+
+
+class RateLimiter:
+    """线程安全的令牌桶，rate为每秒请求数，burst为允许的突发请求数"""
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or max(int(rate), 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """取走一个令牌返回0，令牌不足时返回需等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while (wait := self._reserve()) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """协程版本，等待时不阻塞事件循环；与acquire共用同一个令牌桶"""
+        while (wait := self._reserve()) > 0:
+            await asyncio.sleep(wait)
+
+
+def _new_metric() -> dict:
+    return {"count": 0, "errors": 0, "total_ms": 0.0, "latency_ms": [0] * len(LATENCY_BUCKETS_MS)}
+
+
+class EndpointMetrics:
+    """按端点累计请求次数、错误数与耗时分布
+
+    metrics_key给出时，每flush_interval秒最多一次将新增统计累加到该Redis哈希（跨进程合计）；
+    不另起线程，observe在到达间隔时返回待写入的增量，由调用方随请求写入（异步调用方放到线程中执行）。
+    """
+
+    def __init__(self, metrics_key: str = None, flush_interval: float = 5):
+        self.metrics_key = metrics_key
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, dict] = {}
+        self._unflushed: Dict[str, dict] = {}
+        self._last_flush = 0.0
+
+    def observe(self, endpoint: str, elapsed_ms: float, failed: bool) -> Optional[Dict[str, dict]]:
+        bucket = next(i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound)
+        with self._lock:
+            for metrics in (self._metrics, self._unflushed):
+                metric = metrics.get(endpoint)
+                if metric is None:
+                    metric = metrics[endpoint] = _new_metric()
+                metric["count"] += 1
+                metric["errors"] += failed
+                metric["total_ms"] += elapsed_ms
+                metric["latency_ms"][bucket] += 1
+            now = time.monotonic()
+            if self.metrics_key and now - self._last_flush >= self.flush_interval:
+                pending, self._unflushed, self._last_flush = self._unflushed, {}, now
+                return pending
+        return None
+
+    def flush(self, pending: Dict[str, dict]):
+        try:
+            with redis_client.pipeline(transaction=False) as pipe:
+                for endpoint, metric in pending.items():
+                    pipe.hincrby(self.metrics_key, f"{endpoint}|count", metric["count"])
+                    pipe.hincrby(self.metrics_key, f"{endpoint}|errors", metric["errors"])
+                    pipe.hincrbyfloat(self.metrics_key, f"{endpoint}|total_ms", metric["total_ms"])
+                    for i, hits in enumerate(metric["latency_ms"]):
+                        if hits:
+                            pipe.hincrby(self.metrics_key, f"{endpoint}|le_{i}", hits)
+                pipe.execute()
+        except Exception as e:
+            # 统计失败不影响业务请求，本批增量丢弃
+            logger.warning(f"HTTP请求统计写入Redis失败: {str(e)}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            endpoints = {k: {**v, "latency_ms": list(v["latency_ms"])} for k, v in self._metrics.items()}
+        return {"latency_buckets_ms": [str(b) for b in LATENCY_BUCKETS_MS], "endpoints": endpoints}
+
+
+class InstrumentedSession(requests.Session):
+    """未显式传入timeout时使用默认超时，并记录每个端点的请求次数、错误数与耗时分布（见EndpointMetrics）"""
+
+    def __init__(self, timeout: Tuple[float, float] = (5, 30), rate_limiter: RateLimiter = None, metrics_key: str = None, flush_interval: float = 5):
+        super().__init__()
+        self.default_timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.endpoint_metrics = EndpointMetrics(metrics_key, flush_interval)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", self.default_timeout)
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            pending = self.endpoint_metrics.observe(endpoint_template(method, url), (time.perf_counter() - start) * 1000, failed)
+            if pending:
+                self.endpoint_metrics.flush(pending)
+
+    def metrics(self) -> dict:
+        return self.endpoint_metrics.snapshot()
+
+
+def shared_metrics(metrics_key: str) -> dict:
+    """读取所有进程汇总到Redis的统计，结构与InstrumentedSession.metrics()一致"""
+    endpoints: Dict[str, dict] = {}
+    for field, value in redis_client.hgetall(metrics_key).items():
+        endpoint, name = field.decode().rsplit("|", 1)
+        metric = endpoints.setdefault(endpoint, _new_metric())
+        if name.startswith("le_"):
+            metric["latency_ms"][int(name[3:])] = int(value)
+        elif name == "total_ms":
+            metric["total_ms"] = float(value)
+        else:
+            metric[name] = int(value)
+    return {"latency_buckets_ms": [str(b) for b in LATENCY_BUCKETS_MS], "endpoints": endpoints}
+
+
+def create_session(pool_size: int = 20, retries: int = 3, backoff: float = 0.5, timeout: Tuple[float, float] = (5, 30), verify: bool = True, rate_limit: float = 0, metrics_key: str = None) -> InstrumentedSession:
+    """连接错误与429/5xx按指数退避重试；仅重试幂等方法，POST创建类请求不会被重复提交
+
+    rate_limit>0时该会话所有请求共享一个令牌桶限速（每秒请求数）；metrics_key见InstrumentedSession。
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = InstrumentedSession(timeout, RateLimiter(rate_limit) if rate_limit > 0 else None, metrics_key=metrics_key)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.verify = verify
+    return session
+
+
+class SharedSession:
+    """进程内共享的会话；Celery prefork子进程中按pid重建，避免与父进程共用连接"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    def get(self) -> InstrumentedSession:
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._factory()
+                    self._pid = os.getpid()
+        return self._session
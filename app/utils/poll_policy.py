@@ -0,0 +1,77 @@
+"""扫描进度自适应轮询：根据进度变化速度估算剩余时间安排下一次轮询，并记录每个任务的轮询次数"""
+import time
+from typing import Optional
+from app.extensions import redis_client
+
+class AdaptivePollPolicy:
+    """下一次轮询间隔取预计剩余时间的一半，限制在[min_interval, max_interval]内
+
+    进度未知或尚未观察到进度变化时从2倍最小间隔起按倍数退避至max_interval；进度达到near_progress后按最小间隔轮询，
+    使短扫描尽快收尾，长扫描在中段拉长间隔减少无效轮询。
+    """
+
+    def __init__(self, scanner: str, min_interval: float = 5, max_interval: float = 120, near_progress: float = 95, max_polls: int = 1000, state_ttl: int = 7 * 24 * 3600):
+        self.scanner = scanner
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.near_progress = near_progress
+        self.max_polls = max_polls
+        self.state_ttl = state_ttl
+
+    def _key(self, task_id) -> str:
+        return f"poll_state_{self.scanner}_{task_id}"
+
+    def record(self, task_id, progress: Optional[float]) -> float:
+        """记录一次轮询并返回距下一次轮询的秒数"""
+        key = self._key(task_id)
+        now = time.time()
+        state = {k.decode(): v.decode() for k, v in redis_client.hgetall(key).items()}
+        update = {"polls": int(state.get("polls", 0)) + 1, "last_poll": now}
+        base_progress = float(state.get("base_progress", progress if progress is not None else 0))
+        elapsed = now - float(state.get("base_time", now))
+        moving = progress is not None and progress > base_progress and elapsed > 0
+        # 连续未观察到进度推进的次数，用于退避
+        update["flat_polls"] = 0 if moving else int(state.get("flat_polls", 0)) + 1
+        if progress is not None:
+            update["last_progress"] = progress
+            # 以首次观测到的进度为基准估算推进速度
+            if "base_progress" not in state:
+                update["base_progress"] = progress
+                update["base_time"] = now
+        with redis_client.pipeline() as pipe:
+            pipe.hset(key, mapping=update)
+            pipe.expire(key, self.state_ttl)
+            pipe.execute()
+
+        if progress is not None and progress >= self.near_progress:
+            return self.min_interval
+        if not moving:
+            # 进度未知或停滞时从2倍最小间隔起按倍数退避，避免长扫描前期频繁空轮询
+            return min(self.max_interval, self.min_interval * 2 ** update["flat_polls"])
+        remaining = (100 - progress) * elapsed / (progress - base_progress)
+        return max(self.min_interval, min(self.max_interval, remaining / 2))
+
+    def poll_count(self, task_id) -> int:
+        polls = redis_client.hget(self._key(task_id), "polls")
+        return int(polls) if polls else 0
+
+    def exhausted(self, task_id) -> bool:
+        return self.poll_count(task_id) >= self.max_polls
+
+    def stats(self, task_id) -> dict:
+        state = {k.decode(): v.decode() for k, v in redis_client.hgetall(self._key(task_id)).items()}
+        return {
+            "polls": int(state.get("polls", 0)),
+            "last_progress": float(state["last_progress"]) if "last_progress" in state else None,
+            "last_poll": float(state["last_poll"]) if "last_poll" in state else None,
+        }
+
+
+def poll_policy(scanner: str, config) -> AdaptivePollPolicy:
+    """按扫描器读取配置构造轮询策略，如scanner="AWVS"读取AWVS_POLL_*配置"""
+    return AdaptivePollPolicy(
+        scanner,
+        min_interval=config[f"{scanner}_POLL_MIN_INTERVAL"],
+        max_interval=config[f"{scanner}_POLL_MAX_INTERVAL"],
+        max_polls=config[f"{scanner}_POLL_MAX_COUNT"],
+    )
@@ -0,0 +1,77 @@
+"""基于Redis的分布式租约锁与主节点选举"""
+import logging
+import threading
+import time
+from uuid import uuid4
+from app.extensions import redis_client
+
+logger = logging.getLogger(__name__)
+
+class RedisLease:
+    """SET NX PX实现的租约锁，续期与释放均校验持有者token"""
+    _RENEW_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    _RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, name: str, ttl: float = 30, client=None):
+        self.name = name
+        self.ttl_ms = int(ttl * 1000)
+        self.client = client or redis_client
+        self.token = uuid4().hex
+        self.held = False
+
+    def acquire(self, blocking_timeout: float = 0) -> bool:
+        deadline = time.monotonic() + blocking_timeout
+        while True:
+            if self.client.set(self.name, self.token, nx=True, px=self.ttl_ms):
+                self.held = True
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+
+    def renew(self) -> bool:
+        self.held = bool(self.client.eval(self._RENEW_SCRIPT, 1, self.name, self.token, self.ttl_ms))
+        return self.held
+
+    def release(self):
+        if self.held:
+            try:
+                self.client.eval(self._RELEASE_SCRIPT, 1, self.name, self.token)
+            finally:
+                self.held = False
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class LeaderElection:
+    """多个worker竞争同一租约，持有者为主节点；租约每ttl/3续期，主节点失联后由其他节点接管"""
+
+    def __init__(self, name: str, ttl: float = 30):
+        self.lease = RedisLease(name, ttl)
+        self.interval = ttl / 3
+
+    @property
+    def is_leader(self) -> bool:
+        return self.lease.held
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"leader-{self.lease.name}", daemon=True).start()
+
+    def _run(self):
+        while True:
+            was_leader = self.lease.held
+            try:
+                if self.lease.held:
+                    self.lease.renew()
+                else:
+                    self.lease.acquire()
+            except Exception as e:
+                self.lease.held = False
+                logger.error(f"主节点选举异常: {str(e)}")
+            if self.lease.held != was_leader:
+                logger.info(f"{self.lease.name}: {'成为主节点' if self.lease.held else '失去主节点身份'}")
+            time.sleep(self.interval)
@@ -0,0 +1,238 @@
+"""漏洞向量相似度索引（按任务、按工具维护，支持增量插入与阈值top-k查询）"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+import logging
+import threading
+from typing import List, Optional, Tuple
+import numpy as np
+from app.utils.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+class SimilarityIndex(ABC):
+    """相似度索引基类，向量需预先归一化，得分为余弦相似度"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    @abstractmethod
+    def add(self, ids: List[int], vectors: np.ndarray):
+        """增量插入向量"""
+
+    @abstractmethod
+    def search(self, queries: np.ndarray, k: int = 1, threshold: float = 0.0) -> List[List[Tuple[int, float]]]:
+        """返回每个查询向量得分高于threshold的最多k个(id, score)，按得分降序"""
+
+    @abstractmethod
+    def __contains__(self, item_id: int) -> bool:
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+class FlatIndex(SimilarityIndex):
+    """基于NumPy的精确暴力索引，分块计算以限制峰值内存"""
+    QUERY_BLOCK = 256
+    DATA_BLOCK = 8192
+
+    def __init__(self, dim: int, initial_capacity: int = 1024):
+        super().__init__(dim)
+        self._data = np.empty((initial_capacity, dim), dtype=np.float32)
+        self._ids = np.empty(initial_capacity, dtype=np.int64)
+        self._id_set = set()
+        self._size = 0
+
+    def add(self, ids: List[int], vectors: np.ndarray):
+        if not len(ids):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        need = self._size + len(ids)
+        if need > len(self._data):
+            capacity = max(need, len(self._data) * 2)
+            self._data = np.resize(self._data, (capacity, self.dim))
+            self._ids = np.resize(self._ids, capacity)
+        self._data[self._size:need] = vectors
+        self._ids[self._size:need] = ids
+        self._id_set.update(int(i) for i in ids)
+        self._size = need
+
+    def search(self, queries: np.ndarray, k: int = 1, threshold: float = 0.0) -> List[List[Tuple[int, float]]]:
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        results = [[] for _ in range(len(queries))]
+        if self._size == 0 or len(queries) == 0:
+            return results
+        k = min(k, self._size)
+
+        for qs in range(0, len(queries), self.QUERY_BLOCK):
+            q = queries[qs:qs + self.QUERY_BLOCK]
+            best_scores = np.full((len(q), k), -np.inf, dtype=np.float32)
+            best_pos = np.zeros((len(q), k), dtype=np.int64)
+            for ds in range(0, self._size, self.DATA_BLOCK):
+                scores = q @ self._data[ds:min(ds + self.DATA_BLOCK, self._size)].T
+                # 合并当前块与已有top-k
+                merged_scores = np.concatenate([best_scores, scores], axis=1)
+                merged_pos = np.concatenate([best_pos, np.broadcast_to(np.arange(ds, ds + scores.shape[1]), scores.shape)], axis=1)
+                top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(merged_scores, top, axis=1)
+                best_pos = np.take_along_axis(merged_pos, top, axis=1)
+
+            order = np.argsort(-best_scores, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            best_pos = np.take_along_axis(best_pos, order, axis=1)
+            for row in range(len(q)):
+                results[qs + row] = [
+                    (int(self._ids[p]), float(s))
+                    for s, p in zip(best_scores[row], best_pos[row]) if s > threshold
+                ]
+        return results
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._id_set
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class HNSWIndex(SimilarityIndex):
+    """基于hnswlib的近似最近邻索引（可选依赖）"""
+
+    def __init__(self, dim: int, initial_capacity: int = 1024, m: int = 16, ef_construction: int = 200, ef: int = 64):
+        super().__init__(dim)
+        import hnswlib
+        self._index = hnswlib.Index(space="ip", dim=dim)
+        self._index.init_index(max_elements=initial_capacity, ef_construction=ef_construction, M=m)
+        self._index.set_ef(ef)
+        self._ef = ef
+        self._id_set = set()
+
+    def add(self, ids: List[int], vectors: np.ndarray):
+        if not len(ids):
+            return
+        need = len(self._id_set) + len(ids)
+        if need > self._index.get_max_elements():
+            self._index.resize_index(max(need, self._index.get_max_elements() * 2))
+        self._index.add_items(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim), np.asarray(ids, dtype=np.int64))
+        self._id_set.update(int(i) for i in ids)
+
+    def search(self, queries: np.ndarray, k: int = 1, threshold: float = 0.0) -> List[List[Tuple[int, float]]]:
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if not self._id_set or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+        k = min(k, len(self._id_set))
+        self._index.set_ef(max(self._ef, k))
+        labels, distances = self._index.knn_query(queries, k=k)
+        # ip空间距离为 1 - 内积
+        return [
+            [(int(l), float(1 - d)) for l, d in zip(row_labels, row_dist) if 1 - d > threshold]
+            for row_labels, row_dist in zip(labels, distances)
+        ]
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._id_set
+
+    def __len__(self) -> int:
+        return len(self._id_set)
+
+
+INDEX_BACKENDS = {
+    "flat": FlatIndex,
+    "hnsw": HNSWIndex,
+}
+
+def create_index(dim: int, backend: str = "flat") -> SimilarityIndex:
+    """按配置创建索引，可选后端依赖未安装时回退到FlatIndex"""
+    index_cls = INDEX_BACKENDS.get(backend)
+    if index_cls is None:
+        raise ValidationError(f"不支持的相似度索引后端: {backend}")
+    try:
+        return index_cls(dim)
+    except ImportError:
+        logger.warning(f"相似度索引后端{backend}不可用，回退到flat")
+        return FlatIndex(dim)
+
+
+class UnionFind:
+    """并查集（路径减半 + 按大小合并）"""
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+
+
+def cross_tool_groups(embeddings: np.ndarray, labels: List[str], threshold: float, categories: List[Optional[str]] = None, block_size: int = 1024) -> List[List[int]]:
+    """同批次内不同工具间相似度超过阈值的漏洞按连通分量分组，仅返回大小>1的组
+
+    categories给出时，仅类型兼容（任一方未归类或类型相同）的漏洞之间连边
+    """
+    n = len(labels)
+    if n < 2:
+        return []
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    _, tool_ids = np.unique(np.asarray(labels), return_inverse=True)
+    if categories is not None:
+        # 未归类记为-1
+        names = sorted({c for c in categories if c is not None})
+        category_ids = np.array([names.index(c) if c is not None else -1 for c in categories])
+    columns = np.arange(n)
+    uf = UnionFind(n)
+    # 按行分块计算，仅取上三角且工具不同的位置
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        rows = columns[start:end, None]
+        edges = (embeddings[start:end] @ embeddings.T > threshold) \
+            & (tool_ids[start:end, None] != tool_ids[None, :]) \
+            & (columns[None, :] > rows)
+        if categories is not None:
+            block_categories = category_ids[start:end, None]
+            edges &= (block_categories == category_ids[None, :]) | (block_categories < 0) | (category_ids[None, :] < 0)
+        for i, j in zip(*np.nonzero(edges)):
+            uf.union(start + int(i), int(j))
+
+    groups = defaultdict(list)
+    for i in range(n):
+        groups[uf.find(i)].append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+class TaskIndexRegistry:
+    """进程内按(task_id, 工具)缓存索引，LRU淘汰以限制内存"""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, SimilarityIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, dim: int, backend: str = "flat") -> SimilarityIndex:
+        with self._lock:
+            index = self._entries.get(key)
+            if index is None or index.dim != dim:
+                index = create_index(dim, backend)
+                self._entries[key] = index
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return index
+
+    def drop(self, key: tuple):
+        with self._lock:
+            self._entries.pop(key, None)
+
+task_index_registry = TaskIndexRegistry()
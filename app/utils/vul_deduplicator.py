@@ -1,32 +1,68 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
 import logging
 import os
 from pathlib import Path
+import struct
 from typing import List, Set
-from hashlib import md5
 from flask import current_app
-import torch
 from app.models.vulnerability import Vulnerability
+from app.utils.embedding_backends import load_embedding_model
+from app.utils.embedding_server import EmbeddingClient
+from app.utils.embedding_store import EmbeddingStore
 from app.utils.exceptions import InternalServerError
-from sentence_transformers import SentenceTransformer, util
+from app.utils.similarity_index import SimilarityIndex, create_index, cross_tool_groups, task_index_registry
+from app.utils.vul_fingerprint import fingerprint, is_compatible, is_lexical_duplicate
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+def load_sentence_model():
+    """按配置的推理后端加载本地语义模型"""
+    model_path = Path("./language-models/paraphrase-multilingual-MiniLM-L12-v2")
+    return load_embedding_model(
+        str(model_path),
+        backend=current_app.config.get("EMBEDDING_BACKEND", "torch"),
+        num_threads=current_app.config.get("EMBEDDING_NUM_THREADS", 0),
+    )
+
+def local_sentence_model():
+    """本进程加载的模型，首次使用时加载并在应用上共享"""
+    if not hasattr(current_app, 'sentence_model'):
+        current_app.sentence_model = load_sentence_model()
+    return current_app.sentence_model
+
+class FallbackEncoder:
+    """优先请求编码服务，连接或读取失败（服务未启动、已退出、socket残留）时回退到本进程模型"""
+
+    def __init__(self, client: EmbeddingClient):
+        self.client = client
+
+    def encode(self, sentences: List[str], **kwargs) -> np.ndarray:
+        try:
+            return self.client.encode(sentences, **kwargs)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"向量编码服务不可用，改用本地模型: {str(e)}")
+            return local_sentence_model().encode(sentences, **kwargs)
+
 class VulDeduplicator:
     def __init__(self, threshold: float = 0.82):
-        # 初始化时共享预加载模型
-        if not hasattr(current_app, 'sentence_model'):
-            model_path = Path("./language-models/paraphrase-multilingual-MiniLM-L12-v2")
-            current_app.sentence_model = SentenceTransformer(str(model_path))
-        self.model = current_app.sentence_model
+        # 配置了编码服务时所有worker共用服务端的单个模型，每次使用时重新判断服务是否可用
+        socket_path = current_app.config.get("EMBEDDING_SERVER_SOCKET")
+        if socket_path and os.path.exists(socket_path):
+            self.model = FallbackEncoder(EmbeddingClient(socket_path))
+        else:
+            self.model = local_sentence_model()
         self.threshold = threshold
+        # 非默认后端的向量与torch存在微小差异，单独缓存
+        backend = current_app.config.get("EMBEDDING_BACKEND", "torch")
+        model_tag = MODEL_TAG if backend == "torch" else f"{MODEL_TAG}:{backend}"
+        self.store = EmbeddingStore(self.model, model_tag=model_tag)
 
     def _preprocess(self, text: str) -> str:
         """统一文本预处理流程"""
-        return text.strip().lower().replace('\n', ' ').replace('\t', ' ')[:500]  # 限制长度防止内存溢出
+        return (text or "").strip().lower().replace('\n', ' ').replace('\t', ' ')[:500]  # 限制长度防止内存溢出
 
-    def deduplicate(self, new_vuls: List[Vulnerability], existing_dict: dict) -> List[Vulnerability]:
+    def deduplicate(self, new_vuls: List[Vulnerability], existing_dict: dict, task_id: int = None) -> List[Vulnerability]:
         # 阶段1：基础过滤
         valid_vuls = []
         seen_scan_ids = set()
@@ -36,85 +72,114 @@ class VulDeduplicator:
             seen_scan_ids.add(vul.scan_id)
             valid_vuls.append(vul)
         
-        # 无有效漏洞或仅剩单个漏洞时直接返回
-        if len(valid_vuls) <= 1:
+        # 无有效漏洞时直接返回
+        if not valid_vuls:
             return valid_vuls
 
         # 阶段2：准备对比数据
         # 收集所有需对比的现有漏洞（其他工具）
-        other_tools_vuls = []
-        for tool, vul_map in existing_dict.items():
-            if tool != valid_vuls[0].scan_source:  # 排除当前工具
-                other_tools_vuls.extend(vul_map.values())
-        
-        # 阶段3：批量编码
+        other_tools = {tool: list(vul_map.values()) for tool, vul_map in existing_dict.items()
+                       if tool != valid_vuls[0].scan_source and vul_map}  # 排除当前工具
         batch_descs = [self._preprocess(v.description) for v in valid_vuls]
-        batch_embeddings = self.model.encode(batch_descs, batch_size=64, convert_to_tensor=True)
-        
-        # 阶段4：跨工具相似度匹配
+
+        # 阶段2.5：词法预筛，明显重复直接排除，明显不重复的不再进入语义比对
         keep_mask = [True] * len(valid_vuls)
-        if other_tools_vuls:
-            # 现有漏洞编码（带缓存）
-            cache_key = md5(str([v.description for v in other_tools_vuls]).encode()).hexdigest()
-            if not hasattr(self, '_cache_embeddings') or self._cache_key != cache_key:
-                self._cache_embeddings = self.model.encode(
-                    [self._preprocess(v.description) for v in other_tools_vuls],
-                    batch_size=64,
-                    convert_to_tensor=True
-                )
-                self._cache_key = cache_key
-            
-            # 矩阵式计算相似度
-            similarity_matrix = util.cos_sim(batch_embeddings, self._cache_embeddings)
-            max_similarities, _ = torch.max(similarity_matrix, dim=1)
-            for i, sim in enumerate(max_similarities):
-                if sim > self.threshold:
+        escalated = self._lexical_prefilter(valid_vuls, batch_descs, other_tools, keep_mask)
+        logger.info(f"去重预筛统计: {dict(self.stats)}")
+        if not escalated:
+            return [vul for i, vul in enumerate(valid_vuls) if keep_mask[i]]
+        
+        # 阶段3：批量编码（向量按内容哈希持久化，仅编码新文本）
+        batch_embeddings = self.store.get([batch_descs[i] for i in escalated])
+        
+        # 阶段4：跨工具相似度匹配（按任务、工具维护的增量索引，阈值top-k查询，忽略类型不兼容的命中）
+        for tool, tool_vuls in other_tools.items():
+            index = self._sync_index(task_id, tool, tool_vuls, batch_embeddings.shape[1])
+            for row, hits in enumerate(index.search(batch_embeddings, k=SEARCH_TOP_K, threshold=self.threshold)):
+                i = escalated[row]
+                hit_fps = [self._existing_fps.get(hit_id) for hit_id, _ in hits]
+                if any(hit_fp is None or is_compatible(self._fingerprints[i], hit_fp) for hit_fp in hit_fps):
                     keep_mask[i] = False
 
-        # 阶段5：同批次跨工具检查
-        tool_groups = defaultdict(list)
-        for idx, vul in enumerate(valid_vuls):
-            tool_groups[vul.scan_source].append((idx, vul))
-        
+        # 阶段5：同批次跨工具聚类（复用阶段3向量，并查集合并重复组）
+        kept = [row for row, i in enumerate(escalated) if keep_mask[i]]
+        tool_labels = [valid_vuls[escalated[row]].scan_source for row in kept]
         # 仅当存在多个工具时进行跨批次检查
-        if len(tool_groups) > 1:
-            cross_embeddings = []
-            cross_indices = []
-            for tool, items in tool_groups.items():
-                indices, vuls = zip(*items)
-                descs = [self._preprocess(v.description) for v in vuls]
-                cross_embeddings.append(self.model.encode(descs, convert_to_tensor=True))
-                cross_indices.extend(indices)
-            
-            combined_embeddings = torch.cat(cross_embeddings)
-            tool_labels = [tool for tool, items in tool_groups.items() for _ in items]
-            
-            # 构建工具掩码矩阵
-            mask = torch.zeros((len(tool_labels), len(tool_labels)), dtype=torch.bool)
-            for i in range(len(tool_labels)):
-                for j in range(len(tool_labels)):
-                    if tool_labels[i] != tool_labels[j]:
-                        mask[i][j] = True
-            
-            similarity_matrix = util.cos_sim(combined_embeddings, combined_embeddings)
-            masked_matrix = similarity_matrix * mask.float()
-            
-            # 标记需要排除的项
-            for i in range(masked_matrix.size(0)):
-                if keep_mask[cross_indices[i]] and torch.any(masked_matrix[i] > self.threshold):
-                    # 与同批次其他工具存在相似时，保留最早最高危的
-                    candidates = [valid_vuls[cross_indices[i]]]
-                    for j in torch.where(masked_matrix[i] > self.threshold)[0].tolist():
-                        candidates.append(valid_vuls[cross_indices[j]])
-                    representative = self._select_representative(candidates)
-                    # 标记非代表的项
-                    for cand in candidates:
-                        if cand is not representative:
-                            idx = valid_vuls.index(cand)
-                            keep_mask[idx] = False
+        if len(set(tool_labels)) > 1:
+            categories = [self._fingerprints[escalated[row]].category for row in kept]
+            for group in cross_tool_groups(batch_embeddings[kept], tool_labels, self.threshold, categories=categories):
+                # 同组内保留最早最高危的，其余标记排除
+                indices = [escalated[kept[g]] for g in group]
+                candidates = [valid_vuls[i] for i in indices]
+                representative = self._select_representative(candidates)
+                for i, cand in zip(indices, candidates):
+                    if cand is not representative:
+                        keep_mask[i] = False
 
         return [vul for i, vul in enumerate(valid_vuls) if keep_mask[i]]
 
+    def _lexical_prefilter(self, valid_vuls: List[Vulnerability], batch_descs: List[str], other_tools: dict, keep_mask: List[bool]) -> List[int]:
+        """基于指纹判定明显重复/明显不重复，返回需交由语义模型判断的下标
+
+        统计中findings_*按漏洞条数计，pairs_*按跨工具候选对数计
+        """
+        self.stats = Counter()
+        self._fingerprints = [fingerprint(v, d) for v, d in zip(valid_vuls, batch_descs)]
+        self._existing_fps = {
+            v.vul_id: fingerprint(v, self._preprocess(v.description))
+            for tool_vuls in other_tools.values() for v in tool_vuls
+        }
+        by_path = defaultdict(list)
+        for fp in self._existing_fps.values():
+            if fp.path:
+                by_path[fp.path].append(fp)
+        existing_categories = Counter(fp.category for fp in self._existing_fps.values())
+        batch_categories = Counter((v.scan_source, fp.category) for v, fp in zip(valid_vuls, self._fingerprints))
+
+        escalated = []
+        for i, (vul, fp) in enumerate(zip(valid_vuls, self._fingerprints)):
+            if any(is_lexical_duplicate(fp, other) for other in by_path.get(fp.path, ())):
+                keep_mask[i] = False
+                self.stats["findings_lexical_duplicate"] += 1
+                continue
+
+            # 统计可能重复（类型兼容）的跨工具候选对数
+            total = len(self._existing_fps)
+            compatible = total if fp.category is None else existing_categories[fp.category] + existing_categories[None]
+            for (tool, category), count in batch_categories.items():
+                if tool == vul.scan_source:
+                    continue
+                total += count
+                if fp.category is None or category is None or category == fp.category:
+                    compatible += count
+            self.stats["pairs_lexical_distinct"] += total - compatible
+            if compatible:
+                self.stats["pairs_semantic"] += compatible
+                self.stats["findings_escalated"] += 1
+                escalated.append(i)
+            else:
+                self.stats["findings_lexical_unique"] += 1
+        return escalated
+
+    def _sync_index(self, task_id: int, tool: str, tool_vuls: List[Vulnerability], dim: int) -> SimilarityIndex:
+        """将数据库中尚未入索引的漏洞增量加入索引"""
+        backend = current_app.config.get("DEDUP_INDEX_BACKEND", "flat")
+        if task_id is None:
+            index = create_index(dim, backend)
+        else:
+            index = task_index_registry.get((task_id, tool), dim, backend)
+            # 索引中存在已删除的漏洞时重建
+            indexed = sum(1 for v in tool_vuls if v.vul_id in index)
+            if indexed < len(index):
+                task_index_registry.drop((task_id, tool))
+                index = task_index_registry.get((task_id, tool), dim, backend)
+
+        missing = [v for v in tool_vuls if v.vul_id not in index]
+        if missing:
+            embeddings = self.store.get([self._preprocess(v.description) for v in missing])
+            index.add([v.vul_id for v in missing], embeddings)
+        return index
+
     def _select_representative(self, candidates: list) -> Vulnerability:
         """选择最高危且最早的漏洞"""
         max_sev = max(candidates, key=lambda x: SEVERITY_ORDER[x.severity])
@@ -122,4 +187,6 @@ class VulDeduplicator:
         return min(final_candidates, key=lambda x: x.time)
 
 # 辅助常量
+MODEL_TAG = "paraphrase-multilingual-MiniLM-L12-v2"
+SEARCH_TOP_K = 5  # 跨工具查询的候选数，需过滤类型不兼容的命中
 SEVERITY_ORDER = {"critical":4, "high":3, "medium":2, "low":1, "info":0}
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""漏洞词法指纹（类型归类 + 目标路径 + 描述SimHash），用于语义去重前的快速预筛"""
+from functools import lru_cache
+from hashlib import blake2b
+import re
+from typing import NamedTuple, Optional
+from urllib.parse import urlparse
+import numpy as np
+
+# 仅收录各工具命名差异小、归类明确的漏洞类型，其余归为未知并交由语义模型判断
+CATEGORY_KEYWORDS = (
+    ("sqli", ("sql injection", "sqli", "sqldet", "sql注入")),
+    ("xss", ("xss", "cross site scripting", "cross-site scripting", "跨站脚本")),
+    ("csrf", ("csrf", "cross-site request forgery", "cross site request forgery")),
+    ("path-traversal", ("path traversal", "directory traversal", "path-traversal", "路径遍历")),
+    ("cmd-injection", ("command injection", "cmd-injection", "os command", "命令注入")),
+    ("ssrf", ("ssrf", "server side request forgery", "server-side request forgery")),
+    ("xxe", ("xxe", "xml external entity")),
+    # 不收录单独的"redirect"，避免"HTTP to HTTPS redirect"等信息类告警被归为开放重定向；"redirect/"为Xray插件名前缀
+    ("open-redirect", ("open redirect", "unvalidated redirect", "redirect/", "开放重定向", "url重定向")),
+)
+SIMHASH_BITS = 64
+DUPLICATE_MAX_DISTANCE = 3  # 同类型同路径且SimHash汉明距离不超过该值视为重复
+
+_NUMERIC_SEGMENT = re.compile(r"/\d+(?=/|$)")
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+class Fingerprint(NamedTuple):
+    category: Optional[str]
+    vul_type: str
+    path: Optional[str]
+    simhash: int
+
+
+def categorize(vul_type: str) -> Optional[str]:
+    text = (vul_type or "").lower()
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(k in text for k in keywords):
+            return category
+    return None
+
+def normalize_path(url: str) -> Optional[str]:
+    """host + path，忽略协议、查询参数、末尾斜杠与纯数字路径段"""
+    if not url:
+        return None
+    parsed = urlparse(url.strip().lower())
+    if not parsed.netloc:
+        return None
+    path = _NUMERIC_SEGMENT.sub("/{n}", parsed.path).rstrip("/")
+    return f"{parsed.netloc}{path}"
+
+@lru_cache(maxsize=65536)
+def simhash(text: str, ngram: int = 3) -> int:
+    """字符n-gram SimHash，对中英文均适用（按文本缓存，已入库漏洞无需重复计算）"""
+    text = _NON_WORD.sub(" ", (text or "").lower()).strip()
+    if not text:
+        return 0
+    grams = {text[i:i + ngram] for i in range(max(len(text) - ngram + 1, 1))}
+    digests = b"".join(blake2b(g.encode("utf-8"), digest_size=SIMHASH_BITS // 8).digest() for g in grams)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(grams), -1), axis=1)
+    # 每一位按多数投票
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(grams)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def fingerprint(vul, description: str = None) -> Fingerprint:
+    vul_type = _NON_WORD.sub(" ", (vul.vul_type or "").lower()).strip()
+    return Fingerprint(
+        category=categorize(vul.vul_type),
+        vul_type=vul_type,
+        path=normalize_path(getattr(vul, "url", None)),
+        simhash=simhash(description if description is not None else (vul.description or "")),
+    )
+
+def is_compatible(a: Fingerprint, b: Fingerprint) -> bool:
+    """类型均已归类且不同的两条漏洞不可能重复"""
+    return a.category is None or b.category is None or a.category == b.category
+
+def is_lexical_duplicate(a: Fingerprint, b: Fingerprint) -> bool:
+    if not a.path or a.path != b.path:
+        return False
+    same_type = (a.category is not None and a.category == b.category) or (a.vul_type and a.vul_type == b.vul_type)
+    return bool(same_type) and hamming(a.simhash, b.simhash) <= DUPLICATE_MAX_DISTANCE
@@ -0,0 +1,99 @@
+"""Xray原始输出归档：已解析的字节区间按段gzip压缩存储，并维护原始偏移索引
+
+段文件保存原始字节（含数组括号与分隔符），因此任意原始偏移都能定位到唯一的段。
+扫描进行中Xray仍持有输出文件句柄，直接截断会让其后续写入落在原偏移处，
+因此运行期间对已归档区间打洞（FALLOC_FL_PUNCH_HOLE）释放磁盘、保持偏移不变，扫描结束后再删除活动文件。
+"""
+import ctypes
+import ctypes.util
+import gzip
+import json
+import logging
+import os
+from typing import Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_FALLOC_FL_KEEP_SIZE = 0x01
+_FALLOC_FL_PUNCH_HOLE = 0x02
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+def _load_fallocate():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fallocate = libc.fallocate
+    except (OSError, AttributeError):
+        return None
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+    return fallocate
+
+_fallocate = _load_fallocate()
+
+def punch_hole(path: str, start: int, end: int) -> bool:
+    """释放文件[start, end)区间占用的磁盘块，文件大小与其余内容不变；不支持时返回False"""
+    if _fallocate is None or end <= start:
+        return False
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        if _fallocate(fd, _FALLOC_FL_PUNCH_HOLE | _FALLOC_FL_KEEP_SIZE, start, end - start) != 0:
+            logger.debug(f"打洞失败({path}): {os.strerror(ctypes.get_errno())}")
+            return False
+        return True
+    finally:
+        os.close(fd)
+
+
+class XrayArchive:
+    """单个任务的分段归档，目录结构: {archive_dir}/{task_id}/{start:016d}.json.gz + index.jsonl"""
+    INDEX_FILE = "index.jsonl"
+
+    def __init__(self, archive_dir: str, task_id):
+        self.path = os.path.join(archive_dir, str(task_id))
+
+    def segments(self) -> List[dict]:
+        """按起始偏移排序的段索引 [{"start", "end", "file"}]"""
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return []
+        with open(index_path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def archived_until(self) -> int:
+        segments = self.segments()
+        return segments[-1]["end"] if segments else 0
+
+    def append(self, source: str, start: int, end: int) -> bool:
+        """将source文件[start, end)压缩为一个新段；段写入完成后才追加索引，中途失败不影响已有归档"""
+        if end <= start:
+            return False
+        os.makedirs(self.path, exist_ok=True)
+        name = f"{start:016d}.json.gz"
+        tmp_path = os.path.join(self.path, f".{name}.tmp")
+        remaining = end - start
+        with open(source, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+            src.seek(start)
+            while remaining > 0:
+                chunk = src.read(min(_COPY_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                dst.write(chunk)
+                remaining -= len(chunk)
+        if remaining:
+            os.remove(tmp_path)
+            logger.warning(f"归档源文件长度不足: {source} [{start}, {end})")
+            return False
+        os.replace(tmp_path, os.path.join(self.path, name))
+        with open(os.path.join(self.path, self.INDEX_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps({"start": start, "end": end, "file": name}) + "\n")
+        return True
+
+    def iter_range(self, start: int = 0, end: int = None) -> Iterator[Tuple[int, bytes]]:
+        """按原始偏移读取归档内容，逐段产出(段内首字节的原始偏移, 字节)"""
+        for segment in self.segments():
+            if segment["end"] <= start or (end is not None and segment["start"] >= end):
+                continue
+            with gzip.open(os.path.join(self.path, segment["file"]), "rb") as f:
+                data = f.read()
+            lo = max(start - segment["start"], 0)
+            hi = len(data) if end is None else min(end - segment["start"], len(data))
+            yield segment["start"] + lo, data[lo:hi]
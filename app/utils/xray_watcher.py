@@ -0,0 +1,150 @@
+"""Xray输出目录监听：inotify事件驱动（不可用时回退为轮询文件大小），按任务去抖后触发解析"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import re
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+class _Inotify:
+    """基于libc的最小inotify封装"""
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify监听{path}失败")
+
+    def read_names(self, timeout: float) -> List[str]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names, pos = [], 0
+        while pos + self._EVENT.size <= len(data):
+            _, _, _, length = self._EVENT.unpack_from(data, pos)
+            pos += self._EVENT.size
+            names.append(os.fsdecode(data[pos:pos + length].rstrip(b"\0")))
+            pos += length
+        return names
+
+
+class XrayOutputWatcher:
+    """文件增长时回调on_change(task_id)；同一任务连续写入时去抖，持续写入时最长max_delay触发一次
+
+    on_sweep给出时每sweep_interval秒调用一次全量补扫，兜底漏掉的事件（主节点切换期间、投递失败等）。
+    """
+    FILE_PATTERN = re.compile(r"^(\d+)_xray\.json$")
+
+    def __init__(self, output_dir: str, on_change: Callable[[int], None], debounce: float = 2.0, max_delay: float = 10.0, poll_interval: float = 5.0, enabled: Callable[[], bool] = None, on_sweep: Callable[[], None] = None, sweep_interval: float = 60.0):
+        self.output_dir = output_dir
+        self.on_change = on_change
+        self.enabled = enabled or (lambda: True)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.on_sweep = on_sweep
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self._pending: Dict[int, List[float]] = {}  # task_id -> [首次事件时间, 最近事件时间]
+        self._dispatched_sizes: Dict[int, int] = {}
+        self._polled_sizes: Dict[str, int] = {}
+
+    def start(self):
+        threading.Thread(target=self._run, name="xray-output-watcher", daemon=True).start()
+
+    def _run(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        try:
+            inotify = _Inotify(self.output_dir)
+            logger.info(f"Xray输出监听已启动(inotify): {self.output_dir}")
+        except (OSError, AttributeError) as e:
+            inotify = None
+            logger.warning(f"inotify不可用，回退为轮询: {str(e)}")
+
+        # 启动时补扫一次，处理监听开始前已写入的数据
+        self._poll()
+        last_poll = time.monotonic()
+        while True:
+            try:
+                if inotify:
+                    for name in inotify.read_names(timeout=0.5):
+                        self._mark(name)
+                else:
+                    time.sleep(0.5)
+                    if time.monotonic() - last_poll >= self.poll_interval:
+                        self._poll()
+                        last_poll = time.monotonic()
+                self._flush()
+                self._sweep()
+            except Exception as e:
+                logger.error(f"Xray输出监听异常: {str(e)}")
+                time.sleep(1)
+
+    def _mark(self, name: str):
+        match = self.FILE_PATTERN.match(name)
+        if not match:
+            return
+        now = time.monotonic()
+        self._pending.setdefault(int(match.group(1)), [now, now])[1] = now
+
+    def _poll(self):
+        """轮询模式下仅比较文件大小，无需打开文件"""
+        with os.scandir(self.output_dir) as entries:
+            for entry in entries:
+                if not self.FILE_PATTERN.match(entry.name):
+                    continue
+                size = entry.stat().st_size
+                if self._polled_sizes.get(entry.name) != size:
+                    self._polled_sizes[entry.name] = size
+                    self._mark(entry.name)
+
+    def _sweep(self):
+        if not self.on_sweep or time.monotonic() - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = time.monotonic()
+        if self.enabled():
+            self.on_sweep()
+
+    def _flush(self):
+        if not self.enabled():
+            # 非主节点不触发也不记录大小，接管后首个事件即可触发
+            self._pending.clear()
+            self._dispatched_sizes.clear()
+            return
+        now = time.monotonic()
+        for task_id, (first, last) in list(self._pending.items()):
+            if now - last < self.debounce and now - first < self.max_delay:
+                continue
+            del self._pending[task_id]
+            try:
+                size = os.path.getsize(os.path.join(self.output_dir, f"{task_id}_xray.json"))
+            except OSError:
+                continue
+            previous = self._dispatched_sizes.get(task_id, 0)
+            self._dispatched_sizes[task_id] = size
+            # 文件被截断（归档轮转）时只记录新大小，不触发解析
+            if size <= previous:
+                continue
+            try:
+                self.on_change(task_id)
+            except Exception as e:
+                logger.error(f"任务{task_id}触发Xray解析失败: {str(e)}")
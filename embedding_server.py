@@ -0,0 +1,16 @@
+import os
+from app import create_app
+from app.utils.embedding_server import EmbeddingServer
+from app.utils.vul_deduplicator import load_sentence_model
+
+app = create_app(os.getenv("FLASK_ENV", "production"))
+
+if __name__ == "__main__":
+    socket_path = app.config["EMBEDDING_SERVER_SOCKET"] or "/tmp/vuln_scanner_embedding.sock"
+    server = EmbeddingServer(
+        load_sentence_model(),
+        socket_path,
+        max_batch=app.config["EMBEDDING_MAX_BATCH"],
+        max_wait_ms=app.config["EMBEDDING_MAX_WAIT_MS"],
+    )
+    server.serve_forever()
@@ -0,0 +1,54 @@
+"""AWVS漏洞与概述配对基准：逐条线性查找 vs 按vuln_id建字典
+
+同时校验配对结果：概述列表首个漏洞（下标0）不能被丢弃，配对顺序与漏洞列表一致。
+
+用法: python scripts/bench_awvs_statistics.py [漏洞数,...]
+"""
+import os
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.scanner.AWVS import AWVS
+
+def make_payload(n):
+    ids = [str(uuid4()) for _ in range(n)]
+    vuln_list = [{"vuln_id": vid, "last_seen": "2025-01-01T00:00:00"} for vid in ids]
+    statisticses = [{"vuln_id": vid, "time": f"2025-01-01T00:{i % 60:02d}:00"} for i, vid in enumerate(reversed(ids))]
+    return vuln_list, statisticses
+
+def linear_pairs(vuln_list, statisticses):
+    pairs = []
+    for vul in vuln_list:
+        for sta in statisticses:
+            if vul.get("vuln_id") == sta.get("vuln_id"):
+                pairs.append((vul, sta))
+                break
+    return pairs
+
+def check_index_zero():
+    vuln_list, statisticses = make_payload(3)
+    statisticses = statisticses[::-1]  # 令vuln_list[0]对应概述下标0
+    pairs = AWVS._pair_statistics(vuln_list, statisticses)
+    assert [v["vuln_id"] for v, _ in pairs] == [v["vuln_id"] for v in vuln_list], "下标0的漏洞被丢弃"
+    assert all(v["vuln_id"] == s["vuln_id"] for v, s in pairs)
+    assert AWVS._pair_statistics(vuln_list, []) == []
+
+def main():
+    sizes = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [500, 2000, 5000]
+    check_index_zero()
+    print("下标0校验通过")
+    for n in sizes:
+        vuln_list, statisticses = make_payload(n)
+        start = time.perf_counter()
+        expected = linear_pairs(vuln_list, statisticses)
+        linear = time.perf_counter() - start
+        start = time.perf_counter()
+        pairs = AWVS._pair_statistics(vuln_list, statisticses)
+        indexed = time.perf_counter() - start
+        assert pairs == expected
+        print(f"{n}条 线性查找: {linear * 1000:.1f}ms  字典索引: {indexed * 1000:.2f}ms  加速{linear / indexed:.0f}x")
+
+if __name__ == "__main__":
+    main()
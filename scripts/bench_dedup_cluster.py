@@ -0,0 +1,90 @@
+"""去重阶段5（同批次跨工具聚类）微基准
+
+对比原实现（Python双重循环构建工具掩码 + 逐行候选 + list.index）
+与向量化掩码 + 并查集实现在100/1k/5k条漏洞时的耗时。
+
+用法: python scripts/bench_dedup_cluster.py [规模...]
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.utils.similarity_index import cross_tool_groups
+
+THRESHOLD = 0.82
+TOOLS = ["AWVS", "ZAP", "XRAY"]
+SEVERITIES = ["critical", "high", "medium", "low", "info"]
+SEVERITY_ORDER = {"critical": 4, "high": 3, "medium": 2, "low": 1, "info": 0}
+
+@dataclass(eq=False)
+class FakeVul:
+    scan_source: str
+    severity: str
+    time: datetime
+
+def select_representative(candidates):
+    max_sev = max(candidates, key=lambda x: SEVERITY_ORDER[x.severity])
+    final_candidates = [v for v in candidates if v.severity == max_sev.severity]
+    return min(final_candidates, key=lambda x: x.time)
+
+def make_batch(n, dim=384, dup_ratio=0.3, seed=0):
+    """生成带跨工具重复的归一化向量"""
+    rng = np.random.default_rng(seed)
+    emb = rng.standard_normal((n, dim)).astype(np.float32)
+    dup_idx = rng.choice(n, int(n * dup_ratio), replace=False)
+    emb[dup_idx] = emb[rng.integers(0, n, len(dup_idx))] + 0.05 * rng.standard_normal((len(dup_idx), dim)).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    base = datetime(2025, 1, 1)
+    vuls = [FakeVul(TOOLS[i % len(TOOLS)], SEVERITIES[rng.integers(0, 5)], base + timedelta(seconds=int(i))) for i in range(n)]
+    return vuls, emb
+
+def legacy(vuls, emb):
+    """原实现的NumPy等价版本"""
+    keep_mask = [True] * len(vuls)
+    labels = [v.scan_source for v in vuls]
+    n = len(labels)
+    mask = np.zeros((n, n), dtype=bool)
+    for i in range(n):
+        for j in range(n):
+            if labels[i] != labels[j]:
+                mask[i][j] = True
+    masked = (emb @ emb.T) * mask
+    for i in range(n):
+        if keep_mask[i] and np.any(masked[i] > THRESHOLD):
+            candidates = [vuls[i]] + [vuls[j] for j in np.nonzero(masked[i] > THRESHOLD)[0]]
+            representative = select_representative(candidates)
+            for cand in candidates:
+                if cand is not representative:
+                    keep_mask[vuls.index(cand)] = False
+    return keep_mask
+
+def vectorised(vuls, emb):
+    keep_mask = [True] * len(vuls)
+    for group in cross_tool_groups(emb, [v.scan_source for v in vuls], THRESHOLD):
+        candidates = [vuls[g] for g in group]
+        representative = select_representative(candidates)
+        for g, cand in zip(group, candidates):
+            if cand is not representative:
+                keep_mask[g] = False
+    return keep_mask
+
+def timeit(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in sys.argv[1:]] or [100, 1000, 5000]
+    print(f"{'规模':>6} {'原实现(s)':>12} {'新实现(s)':>12} {'加速比':>8}")
+    for n in sizes:
+        vuls, emb = make_batch(n)
+        old = timeit(legacy, vuls, emb, repeat=1 if n > 1000 else 3)
+        new = timeit(vectorised, vuls, emb)
+        print(f"{n:>6} {old:>12.4f} {new:>12.4f} {old / new:>7.1f}x")
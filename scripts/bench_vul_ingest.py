@@ -0,0 +1,75 @@
+"""漏洞入库基准：逐对象ORM写入 vs 多行upsert
+
+用法: python scripts/bench_vul_ingest.py [数据库URI] [条数]
+默认使用内存SQLite、10000条；传入MySQL测试库URI可测得生产环境的真实差距（会在该库中建表写入数据）。
+"""
+from datetime import datetime
+import os
+import sys
+import time
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.extensions import db
+from app.models import ScanTask, User, Vulnerability
+from app.services.vul import VulService
+
+def make_vuls(task_id, n, prefix):
+    return [Vulnerability(
+        task_id=task_id,
+        scan_source="AWVS",
+        scan_id=f"{prefix}-{i}",
+        vul_type="SQL Injection",
+        url=f"http://example.com/item/{i}",
+        severity="high",
+        description="sql injection in parameter id " * 8,
+        details="<p>payload: ' or 1=1 --</p>" * 10,
+        solution="use parameterized queries",
+        time=datetime.now(),
+    ) for i in range(n)]
+
+def main():
+    uri = sys.argv[1] if len(sys.argv) > 1 else "sqlite://"
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        user = User("bench_user", "bench@example.com", "bench_password")
+        db.session.add(user)
+        db.session.commit()
+        task = ScanTask(user_id=user.user_id, task_name=f"bench_{int(time.time())}", target_url="http://example.com")
+        db.session.add(task)
+        db.session.commit()
+
+        vuls = make_vuls(task.task_id, n, "orm")
+        start = time.perf_counter()
+        db.session.add_all(vuls)
+        db.session.commit()
+        orm_seconds = time.perf_counter() - start
+
+        vuls = make_vuls(task.task_id, n, "bulk")
+        start = time.perf_counter()
+        inserted, updated = VulService._bulk_upsert(task.task_id, vuls)
+        db.session.commit()
+        bulk_seconds = time.perf_counter() - start
+
+        vuls = make_vuls(task.task_id, n, "bulk")
+        start = time.perf_counter()
+        _, re_updated = VulService._bulk_upsert(task.task_id, vuls)
+        db.session.commit()
+        upsert_seconds = time.perf_counter() - start
+
+        print(f"{n}条 ORM逐对象写入: {orm_seconds:.3f}s")
+        print(f"{n}条 多行upsert新增: {bulk_seconds:.3f}s (新增{inserted}, 更新{updated}) 加速{orm_seconds / bulk_seconds:.1f}x")
+        print(f"{n}条 多行upsert重复命中: {upsert_seconds:.3f}s (更新{re_updated})")
+
+        Vulnerability.query.filter_by(task_id=task.task_id).delete()
+        db.session.delete(task)
+        db.session.delete(user)
+        db.session.commit()
+
+if __name__ == "__main__":
+    main()
@@ -19,9 +19,15 @@ FILES=(
   "sentence_bert_config.json"
   "special_tokens_map.json"
   "tokenizer_config.json"
+  "tokenizer.json"
   "vocab.txt"
 )
 
+# 使用onnx推理后端（EMBEDDING_BACKEND=onnx）时额外下载: WITH_ONNX=1 ./downloadmodel.sh
+if [ "${WITH_ONNX:-0}" = "1" ]; then
+  FILES+=("onnx/model.onnx")
+fi
+
 # 颜色定义
 RED='\033[0;31m'
 GREEN='\033[0;32m'
@@ -38,6 +44,7 @@ download_file() {
   local file=$1
   local url="$HUGGINGFACE_URL/$file"
   local target="$CACHE_DIR/$file"
+  mkdir -p "$(dirname "$target")"
   
   echo -e "${YELLOW}正在下载: $file${NC}"
   
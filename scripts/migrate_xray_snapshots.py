@@ -0,0 +1,46 @@
+"""将历史Xray漏洞内联在details中的快照迁移到Blob存储，行内改为snapshot_ref引用
+
+用法: python scripts/migrate_xray_snapshots.py [每批条数]
+可重复执行，已迁移的记录会被跳过。
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app
+from app.extensions import db
+from app.models import Vulnerability
+from app.utils.blob_store import BlobStore
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    app = create_app(os.getenv("FLASK_ENV", "production"))
+    store = BlobStore(app.config["SNAPSHOT_STORE_PATH"])
+    migrated, last_id = 0, 0
+    while True:
+        batch = Vulnerability.query.filter(
+            Vulnerability.scan_source == "XRAY",
+            Vulnerability.vul_id > last_id,
+            Vulnerability.details.like('%"snapshot":%'),
+        ).order_by(Vulnerability.vul_id).limit(batch_size).all()
+        if not batch:
+            break
+        for vul in batch:
+            last_id = vul.vul_id
+            try:
+                details = json.loads(vul.details)
+            except ValueError:
+                continue
+            snapshot = details.pop("snapshot", None)
+            if snapshot is None:
+                continue
+            details["snapshot_ref"] = store.put(snapshot.encode("utf-8")) if snapshot else None
+            vul.details = json.dumps(details, ensure_ascii=False)
+            migrated += 1
+        db.session.commit()
+        print(f"已迁移{migrated}条，当前vul_id={last_id}")
+    print(f"完成，共迁移{migrated}条")
+
+if __name__ == "__main__":
+    main()
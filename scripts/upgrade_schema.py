@@ -0,0 +1,119 @@
+"""已部署数据库的表结构升级（db.create_all不会修改已存在的表）
+
+用法: python scripts/upgrade_schema.py
+可重复执行，已完成的步骤会被跳过。MySQL直接ALTER TABLE；SQLite不支持修改约束，按alembic批量模式重建表。
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from flask import current_app
+import sqlalchemy as sa
+from sqlalchemy import inspect, text
+from app import create_app
+from app.extensions import db
+
+# SQLite中列级UNIQUE没有名称，批量模式按此约定命名后才能删除；MySQL中唯一索引默认以首列命名，不受影响
+NAMING_CONVENTION = {"uq": "uq_%(table_name)s_%(column_0_N_name)s"}
+
+def operations() -> Operations:
+    return Operations(MigrationContext.configure(db.session.connection()))
+
+def unique_constraints(inspector, table):
+    """{约束名: 列名列表}，未命名的约束按NAMING_CONVENTION补全名称"""
+    return {
+        c["name"] or f"uq_{table}_{'_'.join(c['column_names'])}": c["column_names"]
+        for c in inspector.get_unique_constraints(table)
+    }
+
+def add_missing_columns(inspector, table, columns):
+    existing = {c["name"] for c in inspector.get_columns(table)}
+    missing = [column for column in columns if column.name not in existing]
+    if missing:
+        with operations().batch_alter_table(table) as batch:
+            for column in missing:
+                batch.add_column(column)
+    return bool(missing)
+
+def replace_unique_key(inspector, table, legacy_columns, name, columns):
+    """删除按legacy_columns建立的旧唯一键，改为name(columns)"""
+    constraints = unique_constraints(inspector, table)
+    if name in constraints:
+        return False
+    with operations().batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch:
+        for legacy_name, legacy in constraints.items():
+            if legacy in legacy_columns:
+                batch.drop_constraint(legacy_name, type_="unique")
+        batch.create_unique_constraint(name, columns)
+    return True
+
+def upgrade_vul_columns(inspector):
+    """漏洞表新增列：URL、重复命中次数、ZAP插件ID与消息ID"""
+    return add_missing_columns(inspector, "vulnerabilities", [
+        sa.Column("url", sa.String(1024), comment="漏洞所在URL"),
+        sa.Column("plugin_id", sa.String(64), comment="扫描工具中的检测插件ID"),
+        sa.Column("message_id", sa.String(40), comment="扫描工具中触发漏洞的请求消息ID"),
+        sa.Column("hit_count", sa.Integer, nullable=False, server_default="1", comment="重复命中次数"),
+    ])
+
+def upgrade_vul_unique_key(inspector):
+    """漏洞唯一键由scan_id（或(scan_source, scan_id)）改为(task_id, scan_source, scan_id)
+
+    旧的全局scan_id唯一键必须删除，否则批量入库的ON DUPLICATE KEY会命中其他任务的同ID漏洞。
+    """
+    return replace_unique_key(
+        inspector, "vulnerabilities",
+        legacy_columns=(["scan_id"], ["scan_source", "scan_id"]),
+        name="uq_vul_task_source_scan",
+        columns=["task_id", "scan_source", "scan_id"],
+    )
+
+def upgrade_task_zap_scan_key(inspector):
+    """ZAP扫描ID唯一键由zap_id改为(zap_endpoint, zap_id)
+
+    唯一约束对zap_endpoint为NULL的行不生效，历史任务需先回填为当时唯一的实例ZAP_API_URL。
+    """
+    applied = add_missing_columns(inspector, "scan_tasks", [
+        sa.Column("zap_endpoint", sa.String(255), comment="ZAP扫描所在的实例"),
+    ])
+    backfilled = db.session.execute(
+        text("UPDATE scan_tasks SET zap_endpoint = :endpoint WHERE zap_id IS NOT NULL AND zap_endpoint IS NULL"),
+        {"endpoint": current_app.config["ZAP_API_URL"]},
+    )
+    applied = backfilled.rowcount > 0 or applied
+    return replace_unique_key(
+        inspector, "scan_tasks",
+        legacy_columns=(["zap_id"],),
+        name="uq_task_zap_scan",
+        columns=["zap_endpoint", "zap_id"],
+    ) or applied
+
+STEPS = [
+    upgrade_vul_columns,
+    upgrade_vul_unique_key,
+    upgrade_task_zap_scan_key,
+]
+
+def upgrade():
+    """在当前应用上下文中依次执行所有步骤，返回[(步骤名, 是否升级)]"""
+    results = []
+    for step in STEPS:
+        # 每步重新读取表结构，DDL在MySQL中隐式提交
+        applied = step(inspect(db.engine))
+        db.session.commit()
+        results.append((step.__name__, applied))
+    return results
+
+def main():
+    app = create_app(os.getenv("FLASK_ENV", "production"))
+    with app.app_context():
+        if db.engine.dialect.name not in ("mysql", "sqlite"):
+            print(f"不支持的数据库: {db.engine.dialect.name}")
+            return
+        for name, applied in upgrade():
+            print(f"{name}: {'已升级' if applied else '无需升级'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""本地ZAP桩服务：实现扫描流程用到的JSON API子集，用于在没有ZAP的环境下联调实例池、轮询与告警入库
+
+每个扫描按--scan-seconds线性推进进度，并随进度产生--alerts条告警；同一实例运行中的扫描
+超过--max-concurrent时新扫描保持NOT_STARTED排队，用于观察放置策略。
+扫描策略按规则记录启用状态、攻击强度与告警阈值，可用StubZAP.restart模拟ZAP重启后策略被重置。
+支持ZAPv2代理式请求（绝对URL）与httpx直连两种方式，非/JSON路径（如urlopen访问目标）一律返回200。
+
+用法: python scripts/zap_stub.py [--port 8090] [--instances 1] [--scan-seconds 60] [--alerts 20] [--max-concurrent 2]
+多实例时端口依次递增，可配置 ZAP_API_URLS=http://127.0.0.1:8090,http://127.0.0.1:8091
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+# 模拟的扫描规则 (规则ID, 策略分类ID)
+STUB_SCANNERS = (
+    (10045, 0), (90011, 1), (0, 2), (6, 2), (40003, 3),
+    (40012, 4), (40014, 4), (40017, 4), (40018, 4), (40019, 4), (40020, 4),
+    (40021, 4), (40022, 4), (40026, 4), (40027, 4),
+)
+
+
+def default_policy() -> dict:
+    """ZAP新建或重启后的策略：全部规则启用，攻击强度与告警阈值为MEDIUM"""
+    return {sid: {"enabled": True, "attackStrength": "MEDIUM", "alertThreshold": "MEDIUM"} for sid, _ in STUB_SCANNERS}
+
+
+class StubZAP:
+    """单个ZAP实例的内存状态"""
+
+    def __init__(self, scan_seconds: float, alerts_per_scan: int, max_concurrent: int):
+        self.scan_seconds = scan_seconds
+        self.alerts_per_scan = alerts_per_scan
+        self.max_concurrent = max_concurrent
+        self.lock = threading.Lock()
+        self.scans = []  # {"id", "url", "policy", "started", "stopped"}
+        self.policies = {"Default Policy": default_policy()}
+        self.contexts = []
+
+    def restart(self):
+        """模拟ZAP重启：自定义策略丢失，内置策略恢复默认"""
+        with self.lock:
+            self.policies = {"Default Policy": default_policy()}
+
+    def _progress(self, scan, now) -> int:
+        if scan["started"] is None:
+            return 0
+        return min(100, int((now - scan["started"]) * 100 / self.scan_seconds))
+
+    def _state(self, scan, now) -> str:
+        if scan["stopped"]:
+            return "FINISHED"
+        if scan["started"] is None:
+            return "NOT_STARTED"
+        return "FINISHED" if self._progress(scan, now) >= 100 else "RUNNING"
+
+    def _schedule(self, now):
+        """有空闲名额时启动排队中的扫描"""
+        running = sum(self._state(scan, now) == "RUNNING" for scan in self.scans)
+        for scan in self.scans:
+            if running >= self.max_concurrent:
+                break
+            if scan["started"] is None and not scan["stopped"]:
+                scan["started"] = now
+                running += 1
+
+    def _scan(self, scan_id):
+        if not scan_id.isdigit() or int(scan_id) >= len(self.scans):
+            raise LookupError("does_not_exist")
+        return self.scans[int(scan_id)]
+
+    def _alert_ids(self, scan, now):
+        count = self.alerts_per_scan * self._progress(scan, now) // 100
+        return [scan["id"] * self.alerts_per_scan + i for i in range(count)]
+
+    def _alert(self, scan, alert_id):
+        return {
+            "id": str(alert_id),
+            "pluginId": str(40012 + alert_id % 5),
+            "messageId": str(alert_id + 1000),
+            "name": f"Stub alert {alert_id % 5}",
+            "risk": str(alert_id % 4),
+            "url": f"{scan['url'].rstrip('/')}/page/{alert_id}",
+            "description": "ZAP桩服务生成的告警",
+            "solution": "",
+            "reference": "",
+        }
+
+    def _policy_call(self, name: str, params: dict):
+        policy = self.policies.get(params.get("scanPolicyName", "Default Policy"))
+        if policy is None:
+            raise LookupError("does_not_exist")
+        if name == "scanners":
+            return {"scanners": [{
+                "id": str(sid),
+                "policyId": str(category),
+                "enabled": str(policy[sid]["enabled"]).lower(),
+                "attackStrength": policy[sid]["attackStrength"],
+                "alertThreshold": policy[sid]["alertThreshold"],
+            } for sid, category in STUB_SCANNERS]}
+        if name == "enableAllScanners":
+            for rule in policy.values():
+                rule["enabled"] = True
+            return {"Result": "OK"}
+        # 以下接口与ZAP一致，缺少必填的id时返回missing_parameter
+        if "id" not in params and "ids" not in params:
+            raise LookupError("missing_parameter")
+        if name == "enableScanners":
+            for sid in params["ids"].split(","):
+                if int(sid) in policy:
+                    policy[int(sid)]["enabled"] = True
+        elif name == "setPolicyAttackStrength":
+            for sid, category in STUB_SCANNERS:
+                if str(category) == params["id"]:
+                    policy[sid]["attackStrength"] = params["attackStrength"]
+        elif int(params["id"]) in policy:
+            field = "attackStrength" if name == "setScannerAttackStrength" else "alertThreshold"
+            policy[int(params["id"])][field] = params[field]
+        return {"Result": "OK"}
+
+    def handle(self, component: str, kind: str, name: str, params: dict):
+        now = time.time()
+        with self.lock:
+            self._schedule(now)
+            if (component, name) == ("core", "version"):
+                return {"version": "stub"}
+            if (component, name) == ("ascan", "scans"):
+                return {"scans": [{
+                    "id": str(scan["id"]),
+                    "progress": str(self._progress(scan, now)),
+                    "state": self._state(scan, now),
+                } for scan in self.scans]}
+            if (component, name) == ("ascan", "scan"):
+                if params.get("scanPolicyName", "Default Policy") not in self.policies:
+                    raise LookupError("does_not_exist")
+                scan = {"id": len(self.scans), "url": params.get("url"), "policy": params.get("scanPolicyName"), "started": None, "stopped": False}
+                self.scans.append(scan)
+                self._schedule(now)
+                return {"scan": str(scan["id"])}
+            if (component, name) == ("ascan", "status"):
+                return {"status": str(self._progress(self._scan(params.get("scanId", "")), now))}
+            if (component, name) == ("ascan", "stop"):
+                self._scan(params.get("scanId", ""))["stopped"] = True
+                return {"Result": "OK"}
+            if (component, name) == ("ascan", "alertsIds"):
+                return {"alertsIds": [str(i) for i in self._alert_ids(self._scan(params.get("scanId", "")), now)]}
+            if (component, name) == ("core", "alert"):
+                alert_id = int(params.get("id", -1))
+                scan = self.scans[alert_id // self.alerts_per_scan] if 0 <= alert_id < len(self.scans) * self.alerts_per_scan else None
+                if scan is None:
+                    raise LookupError("does_not_exist")
+                return {"alert": self._alert(scan, alert_id)}
+            if (component, name) == ("core", "alerts"):
+                # 按告警ID升序，baseurl过滤后用start/count分页，count为0时返回全部
+                baseurl = params.get("baseurl", "")
+                alerts = [self._alert(scan, alert_id) for scan in self.scans if scan["url"].startswith(baseurl) for alert_id in self._alert_ids(scan, now)]
+                alerts.sort(key=lambda alert: int(alert["id"]))
+                start, count = int(params.get("start", 0)), int(params.get("count", 0))
+                return {"alerts": alerts[start:start + count] if count else alerts[start:]}
+            if (component, name) == ("ascan", "scanPolicyNames"):
+                return {"scanPolicyNames": sorted(self.policies)}
+            if (component, name) == ("ascan", "addScanPolicy"):
+                self.policies[params.get("scanPolicyName")] = default_policy()
+                return {"Result": "OK"}
+            if (component, name) == ("ascan", "removeScanPolicy"):
+                self.policies.pop(params.get("scanPolicyName"), None)
+                return {"Result": "OK"}
+            if component == "ascan" and name in ("scanners", "enableAllScanners", "enableScanners", "setPolicyAttackStrength", "setScannerAttackStrength", "setScannerAlertThreshold"):
+                return self._policy_call(name, params)
+            elif (component, name) == ("context", "newContext"):
+                self.contexts.append(params.get("contextName"))
+                return {"contextId": str(len(self.contexts))}
+            elif (component, name) == ("users", "newUser"):
+                return {"userId": "0"}
+            elif kind == "view":
+                raise LookupError("no_implementor")
+            # 其余action（策略、上下文、认证配置等）仅确认
+            return {"Result": "OK"}
+
+
+def make_handler(zap: StubZAP):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = url.path.strip("/").split("/")
+            if len(parts) < 4 or parts[0] != "JSON":
+                return self._reply(200, {})
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                self._reply(200, zap.handle(parts[1], parts[2], parts[3], params))
+            except LookupError as e:
+                self._reply(400, {"code": str(e), "message": str(e)})
+
+        do_POST = do_GET
+
+        def _reply(self, status, data):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int, zap: StubZAP) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(zap))
+    threading.Thread(target=server.serve_forever, name=f"zap-stub-{port}", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地ZAP桩服务")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--instances", type=int, default=1)
+    parser.add_argument("--scan-seconds", type=float, default=60)
+    parser.add_argument("--alerts", type=int, default=20)
+    parser.add_argument("--max-concurrent", type=int, default=2)
+    args = parser.parse_args()
+    for i in range(args.instances):
+        serve(args.port + i, StubZAP(args.scan_seconds, args.alerts, args.max_concurrent))
+        print(f"ZAP桩服务: http://127.0.0.1:{args.port + i}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""测试公共配置：项目根目录与scripts目录加入导入路径，提供基于临时SQLite库的最小应用"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+import pytest
+from flask import Flask
+from app.config import BaseConfig, TestingConfig
+from app.extensions import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """不连接外部服务、不自动建表的应用，表结构由各测试自行准备"""
+    app = Flask("tests")
+    app.config.from_object(BaseConfig)
+    app.config.from_object(TestingConfig)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
@@ -0,0 +1,30 @@
+"""AWVS._pair_statistics：按vuln_id配对漏洞与概述"""
+import random
+from uuid import uuid4
+from app.services.scanner.AWVS import AWVS
+from bench_awvs_statistics import linear_pairs, make_payload
+
+
+def test_match_at_index_zero_is_kept():
+    vuln_list, statisticses = make_payload(3)
+    # 令vuln_list[0]对应概述下标0
+    statisticses = statisticses[::-1]
+    assert statisticses[0]["vuln_id"] == vuln_list[0]["vuln_id"]
+    pairs = AWVS._pair_statistics(vuln_list, statisticses)
+    assert [v["vuln_id"] for v, _ in pairs] == [v["vuln_id"] for v in vuln_list]
+    assert all(v["vuln_id"] == s["vuln_id"] for v, s in pairs)
+
+
+def test_matches_linear_scan():
+    rng = random.Random(0)
+    vuln_list, statisticses = make_payload(2000)
+    # 概述缺失部分漏洞、含多余条目且顺序打乱
+    statisticses = rng.sample(statisticses, 1500) + [{"vuln_id": str(uuid4())} for _ in range(100)]
+    rng.shuffle(statisticses)
+    assert AWVS._pair_statistics(vuln_list, statisticses) == linear_pairs(vuln_list, statisticses)
+
+
+def test_missing_statistics():
+    vuln_list, _ = make_payload(3)
+    assert AWVS._pair_statistics(vuln_list, []) == []
+    assert AWVS._pair_statistics(vuln_list, None) == []
@@ -0,0 +1,28 @@
+"""TaskService.bulk_create_tasks：入库与投递前逐项校验"""
+import pytest
+from app.extensions import db
+from app.models.scan_task import ScanTask
+from app.services.task import TaskService
+from app.utils.exceptions import ValidationError
+
+
+@pytest.fixture
+def tables(app):
+    db.create_all()
+
+
+@pytest.mark.parametrize("item, message", [
+    ("http://a.example.com", "第1项任务格式错误"),
+    ({"task_name": "t1", "target_url": "http://a.example.com", "scan_type": "deep"}, "第1项扫描类型无效"),
+    ({"task_name": "t1", "target_url": 123}, "第1项无效url"),
+    ({"target_url": "http://a.example.com"}, "第1项任务名称不能为空"),
+])
+def test_invalid_item_names_index(tables, monkeypatch, item, message):
+    queued = []
+    monkeypatch.setattr("app.services.task.register_awvs_targets.apply_async", lambda *a, **kw: queued.append(kw))
+    items = [{"task_name": "t0", "target_url": "http://ok.example.com"}, item]
+    with pytest.raises(ValidationError) as exc:
+        TaskService.bulk_create_tasks(1, items)
+    assert exc.value.message.startswith(message)
+    assert not queued
+    assert ScanTask.query.count() == 0
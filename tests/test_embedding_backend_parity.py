@@ -0,0 +1,33 @@
+"""torch-int8/onnx推理后端与torch基准向量的余弦一致性；模型目录或后端依赖缺失时跳过"""
+import os
+import numpy as np
+import pytest
+from app.config import BaseConfig
+from bench_embedding_backend import SAMPLE_TEXTS
+
+MODEL_DIR = BaseConfig.MODEL_PATH
+# 与scripts/bench_embedding_backend.py的默认上线阈值一致
+MIN_COS = 0.98
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(MODEL_DIR), reason=f"模型目录不存在: {MODEL_DIR}")
+
+
+@pytest.fixture(scope="module")
+def reference():
+    pytest.importorskip("torch")
+    pytest.importorskip("sentence_transformers")
+    from app.utils.embedding_backends import load_embedding_model
+    return load_embedding_model(MODEL_DIR, "torch").encode(SAMPLE_TEXTS, normalize_embeddings=True)
+
+
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx"])
+def test_backend_parity(reference, backend):
+    from app.utils.embedding_backends import load_embedding_model
+    if backend == "onnx":
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("tokenizers")
+        if not os.path.isfile(os.path.join(MODEL_DIR, "onnx", "model.onnx")):
+            pytest.skip("模型目录下没有onnx/model.onnx")
+    vectors = load_embedding_model(MODEL_DIR, backend, num_threads=1).encode(SAMPLE_TEXTS, normalize_embeddings=True)
+    cos = (np.asarray(vectors) * reference).sum(axis=1)
+    assert cos.min() >= MIN_COS, f"{backend}最小余弦{cos.min():.4f}低于{MIN_COS}"
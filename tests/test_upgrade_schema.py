@@ -0,0 +1,101 @@
+"""scripts/upgrade_schema.py：在按初始版本表结构创建的库上升级"""
+import sqlalchemy as sa
+from sqlalchemy import inspect, text
+from app.extensions import db
+from app.models.vulnerability import Vulnerability
+from app.services.vul import VulService
+import upgrade_schema
+
+# 初始版本的表结构（scan_id、zap_id为全局唯一，漏洞表没有url/hit_count/plugin_id/message_id）
+BASELINE = sa.MetaData()
+sa.Table(
+    "users", BASELINE,
+    sa.Column("user_id", sa.Integer, primary_key=True),
+    sa.Column("email", sa.String(50), unique=True, nullable=False),
+    sa.Column("password", sa.String(255), nullable=False),
+    sa.Column("username", sa.String(50), unique=True, nullable=False),
+    sa.Column("role", sa.Enum("user", "admin"), nullable=False),
+    sa.Column("created_at", sa.DateTime, nullable=False),
+    sa.Column("force_reset", sa.Boolean, nullable=False),
+)
+sa.Table(
+    "scan_tasks", BASELINE,
+    sa.Column("task_id", sa.Integer, primary_key=True),
+    sa.Column("awvs_id", sa.String(40), unique=True),
+    sa.Column("zap_id", sa.String(10), unique=True),
+    sa.Column("xray_port", sa.Integer),
+    sa.Column("task_name", sa.String(255), nullable=False, unique=True),
+    sa.Column("user_id", sa.Integer, sa.ForeignKey("users.user_id"), nullable=False),
+    sa.Column("target_url", sa.String(255), nullable=False),
+    sa.Column("scan_type", sa.Enum("full", "xss", "sql", "pass", "quick"), nullable=False),
+    sa.Column("status", sa.Enum("pending", "running", "completed", "failed"), nullable=False),
+    sa.Column("created_at", sa.DateTime, nullable=False),
+    sa.Column("finished_at", sa.DateTime),
+    sa.Column("celery_group_id", sa.String(255)),
+    sa.Column("celery_task_ids", sa.JSON),
+    sa.Column("login_info", sa.String(255)),
+)
+sa.Table(
+    "vulnerabilities", BASELINE,
+    sa.Column("vul_id", sa.Integer, primary_key=True),
+    sa.Column("task_id", sa.Integer, sa.ForeignKey("scan_tasks.task_id", ondelete="CASCADE"), nullable=False),
+    sa.Column("scan_source", sa.String(10), nullable=False),
+    sa.Column("scan_id", sa.String(40), unique=True),
+    sa.Column("vul_type", sa.String(255)),
+    sa.Column("severity", sa.Enum("critical", "high", "medium", "low", "info"), nullable=False),
+    sa.Column("details", sa.Text),
+    sa.Column("description", sa.Text),
+    sa.Column("solution", sa.Text),
+    sa.Column("time", sa.DateTime, nullable=False),
+)
+
+
+def seed():
+    BASELINE.create_all(db.engine)
+    db.session.execute(text(
+        "INSERT INTO users (user_id, email, password, username, role, created_at, force_reset) "
+        "VALUES (1, 'a@b.c', 'x', 'admin', 'admin', '2024-01-01 00:00:00', 0)"
+    ))
+    for task_id in (1, 2):
+        db.session.execute(text(
+            "INSERT INTO scan_tasks (task_id, zap_id, task_name, user_id, target_url, scan_type, status, created_at) "
+            "VALUES (:task_id, :zap_id, :name, 1, 'http://t.local/', 'full', 'completed', '2024-01-01 00:00:00')"
+        ), {"task_id": task_id, "zap_id": str(task_id), "name": f"task{task_id}"})
+    db.session.execute(text(
+        "INSERT INTO vulnerabilities (task_id, scan_source, scan_id, severity, time) "
+        "VALUES (1, 'ZAP', '7', 'high', '2024-01-01 00:00:00')"
+    ))
+    db.session.commit()
+
+
+def test_upgrade_from_baseline(app):
+    app.config["ZAP_API_URL"] = "http://zap:8080"
+    seed()
+
+    results = dict(upgrade_schema.upgrade())
+    assert all(results.values())
+
+    inspector = inspect(db.engine)
+    columns = {c["name"] for c in inspector.get_columns("vulnerabilities")}
+    assert {"url", "hit_count", "plugin_id", "message_id"} <= columns
+    vul_keys = {tuple(c["column_names"]) for c in inspector.get_unique_constraints("vulnerabilities")}
+    assert vul_keys == {("task_id", "scan_source", "scan_id")}
+    task_keys = {tuple(c["column_names"]) for c in inspector.get_unique_constraints("scan_tasks")}
+    assert ("zap_id",) not in task_keys and ("zap_endpoint", "zap_id") in task_keys
+    assert db.session.execute(text("SELECT hit_count FROM vulnerabilities")).scalar() == 1
+    assert {row[0] for row in db.session.execute(text("SELECT zap_endpoint FROM scan_tasks"))} == {"http://zap:8080"}
+
+    # 再次执行全部跳过
+    assert not any(dict(upgrade_schema.upgrade()).values())
+
+
+def test_upsert_after_upgrade_is_scoped_to_task(app):
+    seed()
+    upgrade_schema.upgrade()
+
+    # 另一个任务的同ID告警是新漏洞，不能累加到任务1的记录上
+    assert VulService._bulk_upsert(2, [Vulnerability(scan_source="ZAP", scan_id="7")]) == (1, 0)
+    assert VulService._bulk_upsert(2, [Vulnerability(scan_source="ZAP", scan_id="7")]) == (0, 1)
+    db.session.commit()
+    hits = dict(db.session.execute(text("SELECT task_id, hit_count FROM vulnerabilities WHERE scan_id = '7'")).all())
+    assert hits == {1: 1, 2: 2}